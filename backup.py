@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Резервная копия данных: выгрузка всех таблиц в zip (CSV на таблицу + manifest.json) через COPY TO
+и восстановление через COPY FROM с отложенной проверкой внешних ключей
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import io
+import json
+import sys
+import zipfile
+from datetime import datetime
+
+from psycopg2 import sql, errors
+
+# Версия формата архива; архивы новее текущей не восстанавливаются
+ARCHIVE_FORMAT = 1
+MANIFEST_NAME = "manifest.json"
+
+# Таблицы, которые не входят в копию: учётные записи и сессии остаются на своём экземпляре,
+# счётчики data_version после восстановления увеличивают триггеры
+BACKUP_EXCLUDED_TABLES = ("users", "sessions", "data_version")
+
+# Размер чанков потоковой выдачи архива и их число в очереди между потоками
+STREAM_CHUNK_BYTES = 256 * 1024
+STREAM_QUEUE_CHUNKS = 8
+
+class BackupError(ValueError):
+    """Архив нельзя восстановить: повреждён, от более новой версии или не совпадает со схемой"""
+
+def export_archive(conn, fileobj, tables, schema_version):
+    """Пишет архив всех таблиц в fileobj (можно без seek) из одного снимка БД; возвращает манифест.
+
+    tables — {таблица: [столбцы]} в порядке SCHEMA. Данные идут из COPY TO прямо в сжатый
+    элемент zip, поэтому память не зависит от объёма истории.
+    """
+    manifest = {
+        "format": ARCHIVE_FORMAT,
+        "schema_version": schema_version,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "tables": [],
+    }
+    conn.rollback()
+    cur = conn.cursor()
+    try:
+        # Все таблицы — из одного согласованного снимка
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY;")
+        with zipfile.ZipFile(fileobj, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=6) as archive:
+            for table, columns in tables.items():
+                name = f"{table}.csv"
+                with archive.open(name, "w", force_zip64=True) as member:
+                    cur.copy_expert(sql.SQL("COPY {} ({}) TO STDOUT WITH (FORMAT csv, HEADER)").format(
+                        sql.Identifier(table), sql.SQL(", ").join(map(sql.Identifier, columns)),
+                    ), member)
+                manifest["tables"].append({"name": table, "file": name, "columns": list(columns), "rows": cur.rowcount})
+            archive.writestr(MANIFEST_NAME, json.dumps(manifest, ensure_ascii=False, indent=2))
+    finally:
+        cur.close()
+        conn.rollback()
+    return manifest
+
+def read_manifest(archive, tables, schema_version):
+    """Читает и проверяет манифест: формат, версию схемы и столбцы таблиц"""
+    try:
+        manifest = json.loads(archive.read(MANIFEST_NAME))
+    except (KeyError, ValueError):
+        raise BackupError("В архиве нет корректного manifest.json")
+    if manifest.get("format") != ARCHIVE_FORMAT:
+        raise BackupError(f"Неподдерживаемый формат архива: {manifest.get('format')}")
+    if manifest.get("schema_version", 0) > schema_version:
+        raise BackupError("Архив создан более новой версией приложения — сначала обновите приложение")
+    for entry in manifest["tables"]:
+        columns = tables.get(entry["name"])
+        if columns is None:
+            raise BackupError(f"Неизвестная таблица в архиве: {entry['name']}")
+        unknown = set(entry["columns"]) - set(columns)
+        if unknown:
+            raise BackupError(f"Неизвестные столбцы {entry['name']}: {', '.join(sorted(unknown))}")
+    return manifest
+
+def restore_archive(conn, fileobj, tables, schema_version, progress=None):
+    """Заменяет данные всех таблиц данными архива одной транзакцией; возвращает {таблица: строк}.
+
+    fileobj должен поддерживать seek (zip читается с конца). Внешние ключи проверяются при COMMIT,
+    поэтому порядок загрузки не важен, а каждая таблица грузится одним COPY FROM.
+    """
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile:
+        raise BackupError("Файл не является zip-архивом резервной копии")
+    restored = {}
+    with archive:
+        manifest = read_manifest(archive, tables, schema_version)
+        cur = conn.cursor()
+        try:
+            cur.execute("SET CONSTRAINTS ALL DEFERRED;")
+            cur.execute(sql.SQL("TRUNCATE {};").format(sql.SQL(", ").join(map(sql.Identifier, tables))))
+            for entry in manifest["tables"]:
+                with archive.open(entry["file"]) as member:
+                    cur.copy_expert(sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv, HEADER)").format(
+                        sql.Identifier(entry["name"]), sql.SQL(", ").join(map(sql.Identifier, entry["columns"])),
+                    ), member)
+                if cur.rowcount != entry["rows"]:
+                    raise BackupError(f"{entry['name']}: загружено {cur.rowcount} строк из {entry['rows']}")
+                restored[entry["name"]] = cur.rowcount
+                if progress:
+                    progress(entry["name"], cur.rowcount)
+            conn.commit()
+        except (errors.IntegrityError, errors.DataError, KeyError, zipfile.BadZipFile) as e:
+            conn.rollback()
+            raise BackupError(f"Архив не согласован со схемой: {e}")
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+    return restored
+
+class PipeWriter(io.RawIOBase):
+    """Файл для записи архива в отдельном потоке и асинхронного чтения чанков в event loop.
+
+    Очередь ограничена, поэтому писатель ждёт медленного клиента, а читатель не занимает поток.
+    Если читатель ушёл (abort), следующая запись прерывает выгрузку BrokenPipeError.
+    """
+
+    def __init__(self, loop):
+        self._loop = loop
+        self._queue = asyncio.Queue(STREAM_QUEUE_CHUNKS)
+        self._buffer = bytearray()
+        self._aborted = False
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer += data
+        if len(self._buffer) >= STREAM_CHUNK_BYTES:
+            self._put(bytes(self._buffer))
+            self._buffer.clear()
+        return len(data)
+
+    def _put(self, item):
+        if self._aborted:
+            raise BrokenPipeError("Получатель архива отключился")
+        try:
+            future = asyncio.run_coroutine_threadsafe(self._queue.put(item), self._loop)
+        except RuntimeError:
+            # Event loop уже закрыт (завершение приложения)
+            self._aborted = True
+            raise BrokenPipeError("Получатель архива отключился")
+        while True:
+            try:
+                future.result(timeout=1)
+                return
+            except concurrent.futures.TimeoutError:
+                if self._aborted:
+                    future.cancel()
+                    raise BrokenPipeError("Получатель архива отключился")
+            except concurrent.futures.CancelledError:
+                self._aborted = True
+                raise BrokenPipeError("Получатель архива отключился")
+
+    def finish(self, error=None):
+        """Отдаёт остаток и признак конца (или ошибку) читателю"""
+        if error is None and self._buffer:
+            self._put(bytes(self._buffer))
+        self._buffer.clear()
+        if not self._aborted:
+            self._put(error)
+
+    async def get(self):
+        """Следующий чанк, None в конце; исключение писателя пробрасывается читателю"""
+        item = await self._queue.get()
+        if isinstance(item, BaseException):
+            raise item
+        return item
+
+    def abort(self):
+        self._aborted = True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Резервная копия данных календаря")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("export", help="выгрузить данные в zip").add_argument("path", help="файл архива ('-' — stdout)")
+    commands.add_parser("restore", help="заменить данные данными из архива").add_argument("path", help="файл архива")
+    args = parser.parse_args()
+
+    import psycopg2
+    from main import DB_CONFIG, BACKUP_TABLES, init_db_schema, current_date
+    from migrations import LATEST_VERSION
+    from habit_stats import rebuild_habit_stats
+    from nutrition_rollup import rebuild_nutrition_daily
+
+    init_db_schema()
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        if args.command == "export":
+            out = sys.stdout.buffer if args.path == "-" else open(args.path, "wb")
+            with out:
+                manifest = export_archive(conn, out, BACKUP_TABLES, LATEST_VERSION)
+            total = sum(entry["rows"] for entry in manifest["tables"])
+            print(f"✅ Выгружено строк: {total} ({len(manifest['tables'])} таблиц)", file=sys.stderr)
+        else:
+            with open(args.path, "rb") as f:
+                restored = restore_archive(
+                    conn, f, BACKUP_TABLES, LATEST_VERSION,
+                    progress=lambda table, rows: print(f"   ... {table}: {rows}", flush=True),
+                )
+            # Сводка привычек в архиве — на день выгрузки; пересчитываем её на сегодня
+            cur = conn.cursor()
+            rebuild_habit_stats(cur, current_date())
+            rebuild_nutrition_daily(cur)
+            conn.commit()
+            cur.close()
+            print(f"✅ Восстановлено строк: {sum(restored.values())}")
+    except BackupError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        conn.close()
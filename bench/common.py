@@ -0,0 +1,68 @@
+"""
+Общее для скриптов замеров: приложение из main.py в этом процессе, сессия для разделов /section/
+и перцентили. Скрипты работают с БД из переменных окружения POSTGRES_* — запускайте их на копии
+"""
+import contextlib
+import os
+import secrets
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+def init_db():
+    main.init_db_pool()
+    main.init_db_schema()
+
+@contextlib.contextmanager
+def bench_session():
+    """Токен сессии первого пользователя (если пользователей нет — создаётся bench); удаляется на выходе"""
+    init_db()
+    conn = main.get_db_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT id FROM users ORDER BY username LIMIT 1;")
+    row = cur.fetchone()
+    if row is None:
+        main.create_user("bench", secrets.token_hex(8))
+        cur.execute("SELECT id FROM users WHERE username = 'bench';")
+        row = cur.fetchone()
+    cur.close()
+    conn.close()
+    token = main.create_session(row[0])
+    try:
+        yield token
+    finally:
+        conn = main.get_db_connection()
+        cur = conn.cursor()
+        cur.execute("DELETE FROM sessions WHERE session_token = %s;", (token,))
+        conn.commit()
+        cur.close()
+        conn.close()
+
+@contextlib.contextmanager
+def running_app(port):
+    """uvicorn с main.app в фоновом потоке на 127.0.0.1:port (без TLS)"""
+    import uvicorn
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("Приложение не запустилось")
+        time.sleep(0.05)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join()
+
+def percentile(values, p):
+    """p-й перцентиль (ближайший ранг) в тех же единицах"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))]
+
+def ms(seconds):
+    return f"{seconds * 1000:.1f} мс"
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Размер и время сжатия основных фрагментов в каждой кодировке (zstd / br / gzip) на текущих данных БД.
+
+Тело раздела читается без сжатия теми же чанками, что отдаёт приложение, и сжимается так же, как это
+делает CompressionMiddleware: ответ одним куском — целиком, потоковый — по чанку со сбросом после каждого.
+Время — медиана из --repeat повторов, уровни берутся из GZIP_LEVEL / BROTLI_QUALITY / ZSTD_LEVEL.
+
+    python bench/compression_sizes.py
+    python bench/compression_sizes.py --endpoint "/section/tasks/marks?show_completed=1" --repeat 9
+"""
+import argparse
+import statistics
+import time
+
+from fastapi.testclient import TestClient
+
+from common import bench_session, main
+from compression import _Stream, available_encodings, compress
+
+ENDPOINTS = (
+    "/app",
+    "/section/habits/marks",
+    "/section/tasks/marks?show_completed=1",
+    "/section/nutrition/meal-log",
+    "/section/nutrition/products",
+    "/section/nutrition/dishes",
+    "/section/nutrition/weight",
+    "/section/nutrition/report",
+    "/section/calendar",
+)
+
+def compress_chunks(chunks, encoding):
+    """Сжатие как у потокового ответа: чанк, сброс, ..., завершение"""
+    stream = _Stream(encoding)
+    out = [stream.compress(chunk) + stream.flush() for chunk in chunks]
+    out.append(stream.finish())
+    return b"".join(out)
+
+def measure(chunks, encoding, repeat):
+    """(размер, медиана времени в секундах)"""
+    if len(chunks) == 1:
+        run = lambda: compress(chunks[0], encoding)
+    else:
+        run = lambda: compress_chunks(chunks, encoding)
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = run()
+        timings.append(time.perf_counter() - started)
+    return len(body), statistics.median(timings)
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--endpoint", action="append", help="раздел вместо стандартного списка (можно несколько)")
+    parser.add_argument("--repeat", type=int, default=5, help="повторов сжатия для медианы")
+    args = parser.parse_args()
+    encodings = available_encodings()
+
+    with bench_session() as token, TestClient(main.app) as client:
+        client.cookies.set("session_token", token)
+        print(f"{'раздел':<40} {'чанков':>6} {'без сжатия':>11}  " + "  ".join(f"{enc:>23}" for enc in encodings))
+        for endpoint in args.endpoint or ENDPOINTS:
+            with client.stream("GET", endpoint, headers={"Accept-Encoding": "identity"}) as response:
+                response.raise_for_status()
+                chunks = [chunk for chunk in response.iter_raw() if chunk]
+            raw = sum(map(len, chunks))
+            cells = []
+            for encoding in encodings:
+                size, seconds = measure(chunks, encoding, args.repeat)
+                cells.append(f"{size / 1024:>8.1f} КБ {size / max(raw, 1):>4.0%} {seconds * 1000:>6.2f} мс")
+            print(f"{endpoint:<40} {len(chunks):>6} {raw / 1024:>8.1f} КБ  " + "  ".join(cells))
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест: задержка быстрых разделов, пока в обработке висят медленные запросы к БД.
+
+Запускает приложение в этом процессе, добавляет маршрут /bench/sleep с pg_sleep и сравнивает
+p50/p99 конкурентных запросов к быстрым разделам без медленных запросов и с ними. Если
+обработчики с БД блокируют event loop или пул потоков мал, p99 второго замера вырастет до
+длительности pg_sleep.
+
+    python bench/load_slow_query.py --requests 400 --concurrency 20 --slow 4 --sleep 2
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from common import bench_session, running_app, percentile, ms, main
+
+FAST_ENDPOINTS = (
+    "/section/habits/categories",
+    "/section/tasks/categories",
+    "/section/nutrition/dishes",
+    "/section/calendar",
+)
+
+@main.app.get("/bench/sleep")
+def bench_sleep(seconds: float = 2.0):
+    # Обычный обработчик с БД: соединение из пула и поток из пула на всё время pg_sleep
+    conn = main.get_db_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT pg_sleep(%s);", (seconds,))
+    cur.close()
+    conn.close()
+    return {"slept": seconds}
+
+async def fast_requests(client, total, concurrency):
+    """Задержки total запросов к FAST_ENDPOINTS по кругу, не больше concurrency одновременно"""
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.get(FAST_ENDPOINTS[i % len(FAST_ENDPOINTS)])
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return latencies
+
+async def keep_slow(client, count, seconds, stop):
+    """Держит count запросов /bench/sleep в обработке, пока не выставлен stop"""
+    async def worker():
+        while not stop.is_set():
+            response = await client.get("/bench/sleep", params={"seconds": seconds}, timeout=seconds + 60)
+            response.raise_for_status()
+    await asyncio.gather(*(worker() for _ in range(count)))
+
+def report(label, latencies):
+    print(f"{label:<22} n={len(latencies)}  p50 {ms(percentile(latencies, 50))}  "
+          f"p99 {ms(percentile(latencies, 99))}  max {ms(max(latencies))}")
+
+async def run(args, base_url, token):
+    limits = httpx.Limits(max_connections=args.concurrency + args.slow)
+    async with httpx.AsyncClient(base_url=base_url, cookies={"session_token": token}, limits=limits, timeout=60) as client:
+        # Прогрев: кэши фрагментов и соединения пула
+        await fast_requests(client, len(FAST_ENDPOINTS) * 2, args.concurrency)
+        report("без медленных", await fast_requests(client, args.requests, args.concurrency))
+
+        stop = asyncio.Event()
+        slow = asyncio.create_task(keep_slow(client, args.slow, args.sleep, stop))
+        # Даём медленным запросам дойти до pg_sleep
+        await asyncio.sleep(0.2)
+        latencies = await fast_requests(client, args.requests, args.concurrency)
+        stop.set()
+        await slow
+        report(f"с {args.slow} x pg_sleep({args.sleep:g})", latencies)
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=400, help="запросов к быстрым разделам в каждом замере")
+    parser.add_argument("--concurrency", type=int, default=20, help="одновременных быстрых запросов")
+    parser.add_argument("--slow", type=int, default=4, help="медленных запросов в обработке")
+    parser.add_argument("--sleep", type=float, default=2.0, help="длительность pg_sleep в секундах")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    with running_app(args.port) as base_url, bench_session() as token:
+        asyncio.run(run(args, base_url, token))
+
+if __name__ == "__main__":
+    main_cli()
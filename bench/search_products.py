@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Задержка поиска продуктов (search_by_name) на каталоге из --products строк.
+
+Добавляет продукты со случайными названиями из словаря, помеченные micro_description = 'bench-seed',
+и замеряет запросы трёх видов: начало названия (btree по lower(name)), опечатка и слово из середины
+(триграммы, GiST). По окончании помеченные продукты удаляются, если не задан --keep.
+
+    python bench/search_products.py --products 100000 --repeat 50
+"""
+import argparse
+import io
+import random
+import statistics
+import time
+import uuid
+
+from common import init_db, percentile, ms, main
+
+SEED_MARK = "bench-seed"
+
+NOUNS = (
+    "Йогурт", "Творог", "Кефир", "Молоко", "Сыр", "Хлеб", "Батон", "Гречка", "Рис", "Овсянка",
+    "Курица", "Индейка", "Говядина", "Свинина", "Лосось", "Треска", "Яблоко", "Банан", "Апельсин", "Груша",
+    "Печенье", "Шоколад", "Сок", "Макароны", "Колбаса", "Сосиски", "Пельмени", "Майонез", "Кетчуп", "Масло",
+)
+ADJECTIVES = (
+    "клубничный", "ванильный", "домашний", "фермерский", "обезжиренный", "цельнозерновой", "копчёный",
+    "запечённый", "отварной", "жареный", "сливочный", "шоколадный", "персиковый", "вишнёвый", "солёный",
+    "острый", "классический", "детский", "диетический", "греческий",
+)
+BRANDS = ("Простоквашино", "Домик", "Весёлый", "Агуша", "Савушкин", "Мираторг", "Петелинка", "Черкизово", "Макфа", "Барилла")
+
+# (вид запроса, строки запроса)
+QUERIES = (
+    ("начало названия", ("йог", "творог", "кури", "шокол", "мак", "сы")),
+    ("опечатка", ("йогрт", "тварог", "курциа", "шеколад", "макорон", "сасиски")),
+    ("середина названия", ("клубничн", "фермерск", "савушкин", "мираторг", "запечён", "греческ")),
+)
+
+def seed_products(count, rng):
+    """Добавляет count продуктов одним COPY и обновляет статистику таблицы"""
+    buffer = io.StringIO()
+    for _ in range(count):
+        name = f"{rng.choice(NOUNS)} {rng.choice(ADJECTIVES)} {rng.choice(BRANDS)} {rng.randint(1, 999)}"
+        buffer.write(f"{uuid.uuid4()}\t{name}\t{rng.randint(20, 900)}\t{SEED_MARK}\n")
+    buffer.seek(0)
+    conn = main.get_db_connection()
+    cur = conn.cursor()
+    cur.copy_expert("COPY product (id, name, calories_per_100g, micro_description) FROM STDIN;", buffer)
+    conn.commit()
+    conn.autocommit = True
+    cur.execute("ANALYZE product;")
+    cur.close()
+    conn.close()
+
+def remove_seeded():
+    conn = main.get_db_connection()
+    cur = conn.cursor()
+    cur.execute("DELETE FROM product WHERE micro_description = %s;", (SEED_MARK,))
+    conn.commit()
+    cur.close()
+    conn.close()
+    return cur.rowcount
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--products", type=int, default=100000, help="сколько продуктов добавить")
+    parser.add_argument("--repeat", type=int, default=50, help="повторов каждого запроса")
+    parser.add_argument("--keep", action="store_true", help="не удалять добавленные продукты")
+    args = parser.parse_args()
+
+    init_db()
+    started = time.perf_counter()
+    seed_products(args.products, random.Random(42))
+    print(f"Добавлено продуктов: {args.products} за {ms(time.perf_counter() - started)}")
+    try:
+        for kind, queries in QUERIES:
+            timings, found = [], []
+            for q in queries:
+                main.search_by_name("product", q)  # прогрев
+                for _ in range(args.repeat):
+                    t = time.perf_counter()
+                    rows = main.search_by_name("product", q)
+                    timings.append(time.perf_counter() - t)
+                found.append(len(rows))
+            print(f"{kind:<18} медиана {ms(statistics.median(timings))}  p99 {ms(percentile(timings, 99))}  "
+                  f"найдено {min(found)}–{max(found)} из {main.SEARCH_LIMIT}")
+    finally:
+        if not args.keep:
+            print(f"Удалено добавленных продуктов: {remove_seeded()}")
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Сборка статики: Tailwind CSS из классов main.py и шаблонов, htmx из vendor,
+имена файлов с хэшем содержимого и manifest.json для asset_url()
+"""
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, "static")
+DIST_DIR = os.path.join(STATIC_DIR, "dist")
+MANIFEST_PATH = os.path.join(DIST_DIR, "manifest.json")
+
+TAILWIND_INPUT = os.path.join(STATIC_DIR, "src", "app.css")
+# Логическое имя ресурса -> готовый файл, который нужно только скопировать с хэшем
+VENDOR_ASSETS = {
+    "htmx.js": os.path.join(STATIC_DIR, "vendor", "htmx-1.9.10.min.js"),
+}
+
+def source_paths():
+    """Файлы, от которых зависит сборка: исходник CSS, main.py и шаблоны (классы Tailwind), vendor"""
+    paths = [TAILWIND_INPUT, os.path.join(BASE_DIR, "main.py"), *VENDOR_ASSETS.values()]
+    for root, _, files in os.walk(os.path.join(BASE_DIR, "templates")):
+        paths.extend(os.path.join(root, name) for name in files)
+    return paths
+
+def assets_outdated():
+    """Статика не собрана или какой-то из исходников изменён после сборки"""
+    try:
+        built = os.path.getmtime(MANIFEST_PATH)
+    except OSError:
+        return True
+    return any(os.path.getmtime(path) > built for path in source_paths() if os.path.exists(path))
+
+def find_tailwind():
+    """Путь к standalone CLI Tailwind: TAILWINDCSS_BIN или tailwindcss в PATH (пакет tailwindcss-bin)"""
+    path = os.getenv("TAILWINDCSS_BIN") or shutil.which("tailwindcss")
+    if not path:
+        raise RuntimeError("Не найден tailwindcss: установите пакет tailwindcss-bin или задайте TAILWINDCSS_BIN")
+    return path
+
+def build_css(output_path):
+    """Собирает минифицированный CSS только с используемыми классами"""
+    subprocess.run(
+        [find_tailwind(), "--input", TAILWIND_INPUT, "--output", output_path, "--minify"],
+        check=True, cwd=os.path.dirname(TAILWIND_INPUT),
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+
+def fingerprint(name, source_path):
+    """Копирует файл в dist под именем с хэшем содержимого, возвращает новое имя"""
+    with open(source_path, "rb") as f:
+        content = f.read()
+    stem, ext = os.path.splitext(name)
+    hashed_name = f"{stem}.{hashlib.sha256(content).hexdigest()[:12]}{ext}"
+    write_atomic(os.path.join(DIST_DIR, hashed_name), content)
+    return hashed_name
+
+def write_atomic(path, content):
+    """Запись через временный файл: параллельная сборка или чтение не видят файл наполовину"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, "wb") as f:
+        f.write(content)
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, path)
+
+def build_assets():
+    """Собирает static/dist, удаляет устаревшие файлы и возвращает манифест {логическое имя: файл}"""
+    os.makedirs(DIST_DIR, exist_ok=True)
+
+    manifest = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        css_path = os.path.join(tmp, "app.css")
+        build_css(css_path)
+        manifest["app.css"] = fingerprint("app.css", css_path)
+    for name, path in VENDOR_ASSETS.items():
+        manifest[name] = fingerprint(name, path)
+
+    write_atomic(MANIFEST_PATH, json.dumps(manifest, indent=2, sort_keys=True).encode())
+    keep = set(manifest.values()) | {os.path.basename(MANIFEST_PATH)}
+    for name in os.listdir(DIST_DIR):
+        if name not in keep and not name.startswith("tmp"):
+            try:
+                os.remove(os.path.join(DIST_DIR, name))
+            except FileNotFoundError:
+                pass
+    return manifest
+
+if __name__ == "__main__":
+    try:
+        manifest = build_assets()
+    except (RuntimeError, subprocess.CalledProcessError) as e:
+        stderr = getattr(e, "stderr", None)
+        print(f"❌ Ошибка сборки статики: {e}" + (f"\n{stderr.decode(errors='replace')}" if stderr else ""))
+        sys.exit(1)
+    print("✅ Статика собрана в static/dist:")
+    for name, hashed_name in sorted(manifest.items()):
+        print(f"   - {name} -> {hashed_name}")
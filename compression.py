@@ -0,0 +1,219 @@
+"""
+ASGI-middleware сжатия ответов (zstd / brotli / gzip) для HTML-фрагментов и статики
+"""
+import hashlib
+import os
+import threading
+import zlib
+from collections import OrderedDict
+
+from metrics import record_cache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Кодировки в порядке предпочтения; недоступные без библиотеки пропускаются
+COMPRESSION_ENCODINGS = [
+    enc.strip() for enc in os.getenv('COMPRESSION_ENCODINGS', 'zstd,br,gzip').split(',') if enc.strip()
+]
+# Ответы меньше этого размера в байтах не сжимаются
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', '1024'))
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', '5'))
+ZSTD_LEVEL = int(os.getenv('ZSTD_LEVEL', '3'))
+# Объём кэша уже сжатых ответов (одинаковое тело сжимается один раз)
+COMPRESSION_CACHE_MAX_BYTES = int(os.getenv('COMPRESSION_CACHE_MAX_BYTES', str(8 * 1024 * 1024)))
+
+COMPRESSIBLE_TYPES = (
+    "text/html", "text/css", "text/plain", "text/javascript",
+    "application/javascript", "application/json", "image/svg+xml",
+)
+
+def _gzip_compressor():
+    return zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+def _brotli_compressor():
+    return brotli.Compressor(quality=BROTLI_QUALITY)
+
+def _zstd_compressor():
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+class _Stream:
+    """Единый интерфейс потокового сжатия: compress(chunk), flush() и finish()"""
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == "br":
+            self._obj = _brotli_compressor()
+            self.compress = self._obj.process
+            self.finish = self._obj.finish
+        else:
+            self._obj = _zstd_compressor() if encoding == "zstd" else _gzip_compressor()
+            self.compress = self._obj.compress
+            self.finish = self._obj.flush
+
+    def flush(self):
+        """Выталкивает накопленное, чтобы клиент получил чанк сразу"""
+        if self.encoding == "br":
+            return self._obj.flush()
+        if self.encoding == "zstd":
+            return self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        return self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+def available_encodings():
+    supported = {"gzip": True, "br": brotli is not None, "zstd": zstandard is not None}
+    return [enc for enc in COMPRESSION_ENCODINGS if supported.get(enc)]
+
+def compress(body, encoding):
+    stream = _Stream(encoding)
+    return stream.compress(body) + stream.finish()
+
+def choose_encoding(accept_encoding, encodings):
+    """Первая из поддерживаемых кодировок, которую принимает клиент (q > 0)"""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    for enc in encodings:
+        if accepted.get(enc, accepted.get("*", 0)) > 0:
+            return enc
+    return None
+
+class CompressedBodyCache:
+    """LRU-кэш сжатых тел по (кодировка, хэш исходного тела), ограниченный по байтам"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                return
+            self._data[key] = value
+            self._size += len(value)
+            while self._size > self.max_bytes:
+                _, old = self._data.popitem(last=False)
+                self._size -= len(old)
+
+class CompressionMiddleware:
+    """Сжимает ответы подходящих типов: целиком (с кэшем) или потоково для streaming-ответов"""
+
+    def __init__(self, app, min_size=None, encodings=None, cache_max_bytes=None):
+        self.app = app
+        self.min_size = COMPRESSION_MIN_SIZE if min_size is None else min_size
+        self.encodings = available_encodings() if encodings is None else encodings
+        self.cache = CompressedBodyCache(COMPRESSION_CACHE_MAX_BYTES if cache_max_bytes is None else cache_max_bytes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.encodings:
+            await self.app(scope, receive, send)
+            return
+        headers = dict((k.lower(), v) for k, v in scope.get("headers", []))
+        encoding = choose_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"), self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await _Responder(self, encoding, send).run(scope, receive)
+
+class _Responder:
+    def __init__(self, middleware, encoding, send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.send = send
+        self.start = None
+        self.stream = None
+        self.passthrough = False
+
+    async def run(self, scope, receive):
+        await self.middleware.app(scope, receive, self.on_send)
+
+    def _should_compress(self, message):
+        if message["status"] in (204, 206, 304):
+            return False
+        headers = dict((k.lower(), v) for k, v in message.get("headers", []))
+        # Диапазон байтов относится к несжатому телу — его сжатие сломало бы докачку
+        if b"content-encoding" in headers or b"content-range" in headers:
+            return False
+        content_type = headers.get(b"content-type", b"").decode("latin-1").split(";")[0].strip()
+        return content_type in COMPRESSIBLE_TYPES
+
+    def _start_headers(self, content_length=None):
+        headers = [
+            (k, v) for k, v in self.start.get("headers", [])
+            if k.lower() not in (b"content-length", b"content-encoding")
+        ]
+        vary = [v for k, v in headers if k.lower() == b"vary"]
+        headers = [(k, v) for k, v in headers if k.lower() != b"vary"]
+        vary_value = b", ".join(vary + [b"Accept-Encoding"]) if vary else b"Accept-Encoding"
+        headers.append((b"vary", vary_value))
+        headers.append((b"content-encoding", self.encoding.encode()))
+        if content_length is not None:
+            headers.append((b"content-length", str(content_length).encode()))
+        # Сжатое представление отличается от исходного — помечаем ETag кодировкой
+        for i, (k, v) in enumerate(headers):
+            if k.lower() == b"etag" and v.endswith(b'"'):
+                headers[i] = (k, v[:-1] + b"-" + self.encoding.encode() + b'"')
+        return {**self.start, "headers": headers}
+
+    async def on_send(self, message):
+        if message["type"] == "http.response.start":
+            self.start = message
+            self.passthrough = not self._should_compress(message)
+            if self.passthrough:
+                await self.send(message)
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.stream is None and not more_body:
+            # Ответ целиком: маленький отдаём как есть, остальное сжимаем через кэш
+            if len(body) < self.middleware.min_size:
+                await self.send(self.start)
+                await self.send(message)
+                return
+            key = (self.encoding, hashlib.sha1(body).digest())
+            compressed = self.middleware.cache.get(key)
+            record_cache("compression", compressed is not None)
+            if compressed is None:
+                compressed = compress(body, self.encoding)
+                self.middleware.cache.set(key, compressed)
+            await self.send(self._start_headers(len(compressed)))
+            await self.send({"type": "http.response.body", "body": compressed})
+            return
+
+        # Потоковый ответ: сжимаем по мере поступления чанков
+        if self.stream is None:
+            self.stream = _Stream(self.encoding)
+            await self.send(self._start_headers())
+        data = self.stream.compress(body) if body else b""
+        data += self.stream.flush() if more_body else self.stream.finish()
+        await self.send({"type": "http.response.body", "body": data, "more_body": more_body})
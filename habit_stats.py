@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Серии и доля выполнения привычек: сводка habit_stats, которую инкрементально обновляют
+отметки и суточный rollover, и полный пересчёт оконными функциями для бэкфилла
+"""
+from datetime import timedelta
+
+# Окна доли выполнения в днях; для каждого в habit_stats есть столбец done_<окно>
+STATS_WINDOWS = (7, 30, 365)
+
+# Столбцы сводки в порядке, который ожидает summarize()
+STATS_COLUMNS = "current_streak, streak_end, best_before, done_7, done_30, done_365, first_date, as_of"
+
+# Полный пересчёт по истории на дату day для привычек из scope (одна, без сводки или все).
+# Серия — «остров» подряд идущих выполненных дней: у них date - row_number() одинаков.
+# current_streak — длина последней серии (заканчивается в streak_end), best_before — лучшая из прежних.
+REBUILD_SQL = '''
+    WITH scope AS (
+        SELECT h.id FROM habit h
+        WHERE (%(habit_id)s::uuid IS NULL OR h.id = %(habit_id)s::uuid)
+          AND (NOT %(missing)s OR NOT EXISTS (SELECT 1 FROM habit_stats s WHERE s.habit_id = h.id))
+    ),
+    entries AS (
+        SELECT e.habit_id, e.date, e.completed,
+            e.date - (ROW_NUMBER() OVER (PARTITION BY e.habit_id, e.completed ORDER BY e.date))::int AS run
+        FROM habit_entry e JOIN scope ON scope.id = e.habit_id
+        WHERE e.date <= %(day)s
+    ),
+    runs AS (
+        SELECT habit_id, MAX(date) AS run_end, COUNT(*) AS length,
+            ROW_NUMBER() OVER (PARTITION BY habit_id ORDER BY MAX(date) DESC) AS recency
+        FROM entries
+        WHERE completed
+        GROUP BY habit_id, run
+    ),
+    streaks AS (
+        SELECT habit_id,
+            MAX(run_end) FILTER (WHERE recency = 1) AS streak_end,
+            MAX(length) FILTER (WHERE recency = 1) AS current_streak,
+            MAX(length) FILTER (WHERE recency > 1) AS best_before
+        FROM runs
+        GROUP BY habit_id
+    ),
+    totals AS (
+        SELECT habit_id, MIN(date) AS first_date,
+            COUNT(*) FILTER (WHERE completed AND date > %(day)s - 7) AS done_7,
+            COUNT(*) FILTER (WHERE completed AND date > %(day)s - 30) AS done_30,
+            COUNT(*) FILTER (WHERE completed AND date > %(day)s - 365) AS done_365
+        FROM entries
+        GROUP BY habit_id
+    )
+    INSERT INTO habit_stats (habit_id, as_of, first_date, current_streak, streak_end, best_before, done_7, done_30, done_365)
+    SELECT scope.id, %(day)s, t.first_date,
+        COALESCE(s.current_streak, 0), s.streak_end, COALESCE(s.best_before, 0),
+        COALESCE(t.done_7, 0), COALESCE(t.done_30, 0), COALESCE(t.done_365, 0)
+    FROM scope
+    LEFT JOIN totals t ON t.habit_id = scope.id
+    LEFT JOIN streaks s ON s.habit_id = scope.id
+    ON CONFLICT (habit_id) DO UPDATE SET
+        as_of = EXCLUDED.as_of, first_date = EXCLUDED.first_date,
+        current_streak = EXCLUDED.current_streak, streak_end = EXCLUDED.streak_end,
+        best_before = EXCLUDED.best_before, done_7 = EXCLUDED.done_7,
+        done_30 = EXCLUDED.done_30, done_365 = EXCLUDED.done_365;
+'''
+
+# Переход сводок на новый день: новые записи не выполнены, поэтому серии не меняются,
+# а из окон уходят дни (as_of - N, day - N] — это диапазон по индексу (habit_id, date)
+ADVANCE_SQL = '''
+    UPDATE habit_stats s SET
+        done_7 = s.done_7 - (SELECT COUNT(*) FROM habit_entry e WHERE e.habit_id = s.habit_id AND e.completed
+            AND e.date > s.as_of - 7 AND e.date <= %(day)s - 7),
+        done_30 = s.done_30 - (SELECT COUNT(*) FROM habit_entry e WHERE e.habit_id = s.habit_id AND e.completed
+            AND e.date > s.as_of - 30 AND e.date <= %(day)s - 30),
+        done_365 = s.done_365 - (SELECT COUNT(*) FROM habit_entry e WHERE e.habit_id = s.habit_id AND e.completed
+            AND e.date > s.as_of - 365 AND e.date <= %(day)s - 365),
+        first_date = COALESCE(s.first_date,
+            (SELECT e.date FROM habit_entry e WHERE e.habit_id = s.habit_id ORDER BY e.date LIMIT 1)),
+        as_of = %(day)s
+    WHERE s.as_of < %(day)s;
+'''
+
+# Отметка за день сводки: окна сдвигаются на ±1, последняя серия продлевается, начинается или укорачивается
+TOGGLE_SQL = f'''
+    UPDATE habit_stats SET
+        done_7 = done_7 + %(delta)s,
+        done_30 = done_30 + %(delta)s,
+        done_365 = done_365 + %(delta)s,
+        best_before = CASE
+            WHEN %(delta)s > 0 AND (streak_end IS NULL OR streak_end < %(date)s - 1)
+            THEN GREATEST(best_before, current_streak) ELSE best_before END,
+        current_streak = CASE
+            WHEN %(delta)s < 0 THEN current_streak - 1
+            WHEN streak_end = %(date)s - 1 THEN current_streak + 1
+            ELSE 1 END,
+        streak_end = CASE WHEN %(delta)s < 0 THEN %(date)s - 1 ELSE %(date)s END
+    WHERE habit_id = %(habit_id)s AND as_of = %(date)s
+      AND (%(delta)s > 0 OR streak_end = %(date)s)
+    RETURNING {STATS_COLUMNS};
+'''
+
+def rebuild_habit_stats(cur, day, habit_id=None, missing_only=False):
+    """Пересчитывает сводку по всей истории: для одной привычки, только отсутствующие или все"""
+    cur.execute(REBUILD_SQL, {'day': day, 'habit_id': habit_id, 'missing': missing_only})
+    return cur.rowcount
+
+def advance_habit_stats(cur, day):
+    """Сдвигает сводки на новый день и создаёт недостающие; вызывается из суточного rollover"""
+    cur.execute(ADVANCE_SQL, {'day': day})
+    advanced = cur.rowcount
+    return advanced + rebuild_habit_stats(cur, day, missing_only=True)
+
+def apply_habit_toggle(cur, habit_id, entry_date, completed, day):
+    """Учитывает переключение отметки в сводке и возвращает её строку (STATS_COLUMNS).
+
+    Отметка за текущий день сводки обновляется за O(1); правка прошлых дней
+    (или сводка ещё не сдвинута rollover-ом) пересчитывает одну привычку.
+    """
+    cur.execute(TOGGLE_SQL, {
+        'habit_id': habit_id, 'date': entry_date, 'delta': 1 if completed else -1,
+    })
+    row = cur.fetchone()
+    if row is not None:
+        return row
+    rebuild_habit_stats(cur, max(day, entry_date), habit_id)
+    cur.execute(f"SELECT {STATS_COLUMNS} FROM habit_stats WHERE habit_id = %s;", (habit_id,))
+    return cur.fetchone()
+
+def summarize(stats, today):
+    """(текущая серия, лучшая серия, {окно: доля 0..1 или None}) из строки STATS_COLUMNS"""
+    current_streak, streak_end, best_before, *done, first_date, as_of = stats
+    if current_streak is None:
+        return None, None, {window: None for window in STATS_WINDOWS}
+    longest = max(best_before, current_streak)
+    # Серия не прервана, пока сегодняшний день ещё не закончился
+    if streak_end is None or streak_end < today - timedelta(days=1):
+        current_streak = 0
+    rates = {}
+    for window, count in zip(STATS_WINDOWS, done):
+        days = min(window, (as_of - first_date).days + 1) if first_date else 0
+        rates[window] = count / days if days > 0 else None
+    return current_streak, longest, rates
+
+if __name__ == "__main__":
+    import psycopg2
+    from main import DB_CONFIG, init_db_schema, current_date
+
+    init_db_schema()
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        cur = conn.cursor()
+        rebuilt = rebuild_habit_stats(cur, current_date())
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"✅ Сводка пересчитана для привычек: {rebuilt}")
@@ -1,15 +1,48 @@
-from fastapi import FastAPI, Request, APIRouter, Form, Query, HTTPException, Response, Cookie
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi import FastAPI, Request, APIRouter, Form, Query, HTTPException, Response, Cookie, UploadFile, File
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
+from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
+from starlette.routing import Match
+from anyio import to_thread, CapacityLimiter, CancelScope
+from anyio.lowlevel import RunVar
 from jinja2 import Environment, FileSystemLoader, select_autoescape
 import psycopg2
 import os
-from psycopg2 import sql
+import sys
+from psycopg2 import sql, errors
+from psycopg2 import pool as pg_pool
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+import threading
+import contextvars
+import functools
+import asyncio
+import logging
+import time
+from zoneinfo import ZoneInfo
+from recurrence import materialize_task_entries, TASK_BACKFILL_DAYS
+from weight_trends import load_weight_series, weight_trend, WEIGHT_TREND_POINTS
+from nutrition_rollup import affected_days, refresh_nutrition_days, rebuild_nutrition_daily, nutrition_report, REPORT_PERIODS
+from habit_stats import rebuild_habit_stats, advance_habit_stats, apply_habit_toggle, summarize, STATS_COLUMNS, STATS_WINDOWS
+from compression import CompressionMiddleware
+from metrics import (
+    init_metrics, render_metrics, mark_process_dead, record_cache, observe_request, REQUESTS_IN_PROGRESS,
+    DB_POOL_CONNECTIONS, DB_POOL_MAX, DB_POOL_TIMEOUTS, DB_CONNECT_SECONDS, ROLLOVER_DURATION, ROLLOVER_FAILURES, ROLLOVER_LAST_SUCCESS,
+)
+from request_timing import TimedCursor, RequestStats, request_stats, record_connect, log_request, SERVER_TIMING
+from product_import import import_products, iter_records, detect_format, format_summary, ProductImportError
+from backup import export_archive, restore_archive, PipeWriter, BackupError, BACKUP_EXCLUDED_TABLES
+from migrations import LATEST_VERSION, read_schema_state, apply_migrations, record_schema_hash
+from build_assets import STATIC_DIR, MANIFEST_PATH, VENDOR_ASSETS, build_assets, assets_outdated
+import json
 import uuid
-from datetime import date, timedelta, datetime
+from collections import namedtuple, OrderedDict
+from calendar import Calendar
+from datetime import date, timedelta, datetime, time as dt_time, MINYEAR, MAXYEAR
 import hashlib
 import secrets
 
 app = FastAPI()
+logger = logging.getLogger("personal_calendar")
 
 # Настройка Jinja2
 TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), "templates")
@@ -18,6 +51,51 @@ env = Environment(
     autoescape=select_autoescape(["html", "xml"])
 )
 
+# Собранная статика: логическое имя -> файл с хэшем содержимого в static/dist
+asset_manifest = {}
+
+def load_asset_manifest():
+    """Читает manifest.json; если статика не собрана или устарела — собирает её (нужен tailwindcss)"""
+    if assets_outdated():
+        try:
+            build_assets()
+        except Exception as e:
+            if os.path.exists(MANIFEST_PATH):
+                # Старый CSS может не содержать новых классов — страницы будут свёрстаны неверно
+                logger.error("Статика устарела и не пересобрана (python build_assets.py): %s", e)
+    try:
+        with open(MANIFEST_PATH) as f:
+            manifest = json.load(f)
+    except Exception as e:
+        logger.warning("Статика не собрана (python build_assets.py): %s", e)
+        return
+    asset_manifest.clear()
+    asset_manifest.update(manifest)
+
+def asset_url(name):
+    """URL ресурса с хэшем в имени; без сборки — htmx из vendor, CSS отсутствует (None)"""
+    hashed_name = asset_manifest.get(name)
+    if hashed_name:
+        return f"/static/dist/{hashed_name}"
+    if name in VENDOR_ASSETS:
+        return "/static/" + os.path.relpath(VENDOR_ASSETS[name], STATIC_DIR).replace(os.sep, "/")
+    return None
+
+env.globals["asset_url"] = asset_url
+
+class CachedStaticFiles(StaticFiles):
+    """Файлы с хэшем в имени неизменны — браузер кэширует их на год без перепроверки"""
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if self.get_path(scope).startswith("dist" + os.sep):
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        else:
+            response.headers["Cache-Control"] = "public, no-cache"
+        return response
+
+app.mount("/static", CachedStaticFiles(directory=STATIC_DIR), name="static")
+
 # Настройки подключения к БД
 DB_CONFIG = {
     'dbname': os.getenv('POSTGRES_DB', 'calendar_db'),
@@ -27,6 +105,69 @@ DB_CONFIG = {
     'port': os.getenv('POSTGRES_PORT', '5432'),
 }
 
+# Настройки пула подключений
+DB_POOL_CONFIG = {
+    'minconn': int(os.getenv('DB_POOL_MIN', '1')),
+    'maxconn': int(os.getenv('DB_POOL_MAX', '10')),
+    'timeout': float(os.getenv('DB_POOL_TIMEOUT', '30')),
+    'pre_ping': os.getenv('DB_POOL_PRE_PING', '1') == '1',
+}
+
+# Обработчики с запросами к БД синхронные и выполняются в пуле потоков этого размера,
+# чтобы медленный запрос не блокировал event loop
+DB_WORKER_THREADS = int(os.getenv('DB_WORKER_THREADS', str(DB_POOL_CONFIG['maxconn'])))
+
+# Сколько DDL при старте ждёт блокировку таблицы, прежде чем сдаться, а не вешать живые запросы
+SCHEMA_LOCK_TIMEOUT = os.getenv('SCHEMA_LOCK_TIMEOUT', '5s')
+
+# Максимальный объём кэша HTML-фрагментов в байтах
+FRAGMENT_CACHE_MAX_BYTES = int(os.getenv('FRAGMENT_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+
+# Поиск по названиям продуктов и блюд: сколько вариантов показывать и предел времени запроса
+SEARCH_LIMIT = int(os.getenv('SEARCH_LIMIT', '20'))
+SEARCH_TIMEOUT_MS = int(os.getenv('SEARCH_TIMEOUT_MS', '200'))
+# Порог похожести для нечёткого поиска (word_similarity из pg_trgm, от 0 до 1)
+SEARCH_SIMILARITY = float(os.getenv('SEARCH_SIMILARITY', '0.3'))
+
+# Потоковая отдача больших списков: строк из серверного курсора за раз
+# и предельный размер списка, который ещё кладётся в кэш фрагментов
+STREAM_CHUNK_ROWS = int(os.getenv('STREAM_CHUNK_ROWS', '500'))
+STREAM_CACHE_MAX_BYTES = int(os.getenv('STREAM_CACHE_MAX_BYTES', str(1024 * 1024)))
+
+# Идентификатор сборки: входит в ETag, чтобы после обновления шаблонов клиенты не получали старый HTML
+with open(__file__, "rb") as _source:
+    BUILD_ID = hashlib.sha256(_source.read()).hexdigest()[:16]
+
+# Сессии: срок жизни, кэш проверки токена и период очистки просроченных
+SESSION_LIFETIME_DAYS = int(os.getenv('SESSION_LIFETIME_DAYS', '30'))
+SESSION_CACHE_TTL = float(os.getenv('SESSION_CACHE_TTL', '60'))
+SESSION_CACHE_SIZE = int(os.getenv('SESSION_CACHE_SIZE', '1024'))
+SESSION_SWEEP_SECONDS = float(os.getenv('SESSION_SWEEP_SECONDS', '3600'))
+
+# Часовой пояс, в котором наступает новый день (по умолчанию — системный)
+APP_TIMEZONE = ZoneInfo(os.getenv('APP_TIMEZONE')) if os.getenv('APP_TIMEZONE') else None
+# Через сколько секунд после полуночи создавать записи нового дня
+ROLLOVER_DELAY_SECONDS = float(os.getenv('ROLLOVER_DELAY_SECONDS', '5'))
+# Через сколько секунд повторить неудавшийся rollover
+ROLLOVER_RETRY_SECONDS = float(os.getenv('ROLLOVER_RETRY_SECONDS', '60'))
+
+# История отметок задач: строк на страницу и окно по умолчанию в днях (0 — за всё время)
+TASK_HISTORY_PAGE_SIZE = int(os.getenv('TASK_HISTORY_PAGE_SIZE', '50'))
+TASK_HISTORY_DAYS = int(os.getenv('TASK_HISTORY_DAYS', '0'))
+TASK_HISTORY_WINDOWS = [(7, "7 дней"), (30, "30 дней"), (90, "90 дней"), (365, "Год"), (0, "Всё время")]
+
+# ENUM-типы, используемые в SCHEMA
+SCHEMA_ENUMS = {
+    "habit_priority_enum": ["HIGH", "MEDIUM", "LOW"],
+    "task_repeat_enum": ["NONE", "DAILY", "WEEKLY"],
+}
+
+# Расширения Postgres, нужные SCHEMA (pg_trgm — триграммный поиск по названиям)
+SCHEMA_EXTENSIONS = ("pg_trgm",)
+
+# Индекс в описании таблицы: столбцы (или выражения), уникальность, условие частичного индекса и метод
+Index = namedtuple("Index", ["name", "columns", "unique", "where", "using"], defaults=(False, None, "btree"))
+
 SCHEMA = {
     # Пользователи
     "users": [
@@ -38,9 +179,12 @@ SCHEMA = {
     # Сессии
     "sessions": [
         ("id", "UUID PRIMARY KEY"),
-        ("user_id", "UUID REFERENCES users(id)"),
+        ("user_id", "UUID REFERENCES users(id) DEFERRABLE"),
         ("session_token", "VARCHAR(64) UNIQUE NOT NULL"),
-        ("created_at", "TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
+        ("created_at", "TIMESTAMP DEFAULT CURRENT_TIMESTAMP"),
+        # Срок задаёт create_session из SESSION_LIFETIME_DAYS; открытые сессии заполняет COLUMN_BACKFILL
+        ("expires_at", "TIMESTAMP NOT NULL"),
+        Index("sessions_expires_at_idx", ("expires_at",)),
     ],
     # Категории привычек
     "habit_category": [
@@ -52,15 +196,29 @@ SCHEMA = {
         ("id", "UUID PRIMARY KEY"),
         ("name", "VARCHAR(255) NOT NULL"),
         ("description", "TEXT"),
-        ("category_id", "UUID REFERENCES habit_category(id)"),
+        ("category_id", "UUID REFERENCES habit_category(id) DEFERRABLE"),
         ("priority", "habit_priority_enum NOT NULL")
     ],
     # Записи по привычкам
     "habit_entry": [
         ("id", "UUID PRIMARY KEY"),
-        ("habit_id", "UUID REFERENCES habit(id)"),
+        ("habit_id", "UUID REFERENCES habit(id) DEFERRABLE"),
         ("date", "DATE NOT NULL"),
-        ("completed", "BOOLEAN NOT NULL")
+        ("completed", "BOOLEAN NOT NULL"),
+        Index("habit_entry_habit_id_date_key", ("habit_id", "date"), unique=True),
+        Index("habit_entry_date_idx", ("date",)),
+    ],
+    # Сводка серий и доли выполнения по привычкам (см. habit_stats.py)
+    "habit_stats": [
+        ("habit_id", "UUID PRIMARY KEY REFERENCES habit(id) ON DELETE CASCADE DEFERRABLE"),
+        ("as_of", "DATE NOT NULL"),
+        ("first_date", "DATE"),
+        ("current_streak", "INTEGER NOT NULL DEFAULT 0"),
+        ("streak_end", "DATE"),
+        ("best_before", "INTEGER NOT NULL DEFAULT 0"),
+        ("done_7", "INTEGER NOT NULL DEFAULT 0"),
+        ("done_30", "INTEGER NOT NULL DEFAULT 0"),
+        ("done_365", "INTEGER NOT NULL DEFAULT 0"),
     ],
     # Категории задач
     "task_category": [
@@ -72,43 +230,64 @@ SCHEMA = {
         ("id", "UUID PRIMARY KEY"),
         ("name", "VARCHAR(255) NOT NULL"),
         ("description", "TEXT"),
-        ("category_id", "UUID REFERENCES task_category(id)"),
+        ("category_id", "UUID REFERENCES task_category(id) DEFERRABLE"),
         ("date", "DATE NOT NULL"),
         ("repeat", "task_repeat_enum NOT NULL")
     ],
     # Записи по задачам
     "task_entry": [
         ("id", "UUID PRIMARY KEY"),
-        ("task_id", "UUID REFERENCES task(id)"),
+        ("task_id", "UUID REFERENCES task(id) DEFERRABLE"),
         ("date", "DATE NOT NULL"),
-        ("completed", "BOOLEAN NOT NULL")
+        ("completed", "BOOLEAN NOT NULL"),
+        Index("task_entry_task_id_date_key", ("task_id", "date"), unique=True),
+        # Постраничный вывод отметок идёт по ключу (date, id)
+        Index("task_entry_date_id_idx", ("date", "id")),
+        Index("task_entry_open_date_id_idx", ("date", "id"), where="completed = FALSE"),
     ],
     # Продукты
     "product": [
         ("id", "UUID PRIMARY KEY"),
         ("name", "VARCHAR(255) NOT NULL"),
         ("calories_per_100g", "FLOAT NOT NULL"),
-        ("micro_description", "TEXT")
+        ("micro_description", "TEXT"),
+        # Поиск: префикс по btree, нечёткое совпадение — ближайшие по триграммам через GiST
+        Index("product_name_prefix_idx", ("lower(name) text_pattern_ops",)),
+        Index("product_name_trgm_idx", ("name gist_trgm_ops",), using="gist"),
     ],
     # Блюда
     "dish": [
         ("id", "UUID PRIMARY KEY"),
         ("name", "VARCHAR(255) NOT NULL"),
-        ("description", "TEXT")
+        ("description", "TEXT"),
+        Index("dish_name_prefix_idx", ("lower(name) text_pattern_ops",)),
+        Index("dish_name_trgm_idx", ("name gist_trgm_ops",), using="gist"),
     ],
     # Ингредиенты блюда (DishIngredient)
     "dish_ingredient": [
         ("id", "UUID PRIMARY KEY"),
-        ("dish_id", "UUID REFERENCES dish(id) ON DELETE CASCADE"),
-        ("product_id", "UUID REFERENCES product(id) ON DELETE CASCADE"),
-        ("grams", "FLOAT NOT NULL")
+        ("dish_id", "UUID REFERENCES dish(id) ON DELETE CASCADE DEFERRABLE"),
+        ("product_id", "UUID REFERENCES product(id) ON DELETE CASCADE DEFERRABLE"),
+        ("grams", "FLOAT NOT NULL"),
+        Index("dish_ingredient_dish_id_idx", ("dish_id",)),
+        Index("dish_ingredient_product_id_idx", ("product_id",)),
     ],
     # Лог приёмов пищи
     "meal_log": [
         ("id", "UUID PRIMARY KEY"),
         ("date", "DATE NOT NULL"),
-        ("dish_id", "UUID REFERENCES dish(id) ON DELETE CASCADE"),
-        ("consumed_grams", "FLOAT NOT NULL")
+        ("dish_id", "UUID REFERENCES dish(id) ON DELETE CASCADE DEFERRABLE"),
+        ("consumed_grams", "FLOAT NOT NULL"),
+        Index("meal_log_date_idx", ("date",)),
+        # Дни, которые пересчитываются при изменении блюда
+        Index("meal_log_dish_id_date_idx", ("dish_id", "date")),
+    ],
+    # Сводка питания по дням (см. nutrition_rollup.py)
+    "nutrition_daily": [
+        ("date", "DATE PRIMARY KEY"),
+        ("calories", "FLOAT NOT NULL"),
+        ("grams", "FLOAT NOT NULL"),
+        ("meals", "INTEGER NOT NULL"),
     ],
     # Целевые калории
     "calories_goal": [
@@ -119,10 +298,50 @@ SCHEMA = {
     "personal_data": [
         ("id", "UUID PRIMARY KEY"),
         ("date", "DATE NOT NULL"),
-        ("weight", "FLOAT NOT NULL")
+        ("weight", "FLOAT NOT NULL"),
+        Index("personal_data_date_idx", ("date",)),
+    ],
+    # Журнал суточного создания записей
+    "daily_rollover": [
+        ("day", "DATE PRIMARY KEY"),
+        ("habit_entries", "INTEGER NOT NULL"),
+        ("task_entries", "INTEGER NOT NULL"),
+        ("duration_ms", "INTEGER NOT NULL"),
+        ("finished_at", "TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
     ],
+    # Счётчики изменений таблиц для кэша фрагментов (увеличиваются триггерами)
+    "data_version": [
+        ("table_name", "VARCHAR(63) PRIMARY KEY"),
+        ("version", "BIGINT NOT NULL DEFAULT 0")
+    ],
+}
+
+# Значения для строк, уже лежащих в таблице, когда в неё добавляется столбец NOT NULL без значения по умолчанию:
+# (таблица, столбец) -> (SQL-выражение, параметры)
+COLUMN_BACKFILL = {
+    ("sessions", "expires_at"): ("COALESCE(created_at, LOCALTIMESTAMP) + %s * INTERVAL '1 day'", (SESSION_LIFETIME_DAYS,)),
+}
+
+# Таблицы, любое изменение которых увеличивает их счётчик в data_version
+VERSIONED_TABLES = (
+    "habit_category", "habit", "habit_entry", "habit_stats", "task_category", "task", "task_entry",
+    "product", "dish", "dish_ingredient", "meal_log", "nutrition_daily", "calories_goal", "personal_data",
+)
+
+def table_columns(table):
+    """Столбцы таблицы из SCHEMA"""
+    return [item for item in SCHEMA[table] if not isinstance(item, Index)]
+
+# Таблицы резервной копии и их столбцы в порядке SCHEMA
+BACKUP_TABLES = {
+    table: [name for name, _ in table_columns(table)]
+    for table in SCHEMA if table not in BACKUP_EXCLUDED_TABLES
 }
 
+def table_indexes(table):
+    """Индексы таблицы из SCHEMA"""
+    return [item for item in SCHEMA[table] if isinstance(item, Index)]
+
 def create_enum(cur, name, values):
     cur.execute(f"""DO $$
     BEGIN
@@ -132,8 +351,358 @@ def create_enum(cur, name, values):
     END$$;
     """)
 
+class DatabasePool:
+    """Пул подключений к PostgreSQL: ждёт свободный слот и проверяет соединение при выдаче"""
+
+    def __init__(self, minconn, maxconn, timeout=30.0, pre_ping=True, **conn_kwargs):
+        self._pool = pg_pool.ThreadedConnectionPool(minconn, maxconn, **conn_kwargs)
+        # ThreadedConnectionPool бросает PoolError при исчерпании, поэтому ограничиваем выдачу семафором
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self.timeout = timeout
+        self.pre_ping = pre_ping
+        DB_POOL_MAX.set(maxconn)
+
+    def _is_alive(self, conn):
+        if conn.closed:
+            return False
+        if not self.pre_ping:
+            return True
+        try:
+            # Обычный курсор: проверка входит во время получения соединения, а не в запросы
+            cur = conn.cursor(cursor_factory=psycopg2.extensions.cursor)
+            cur.execute("SELECT 1;")
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _update_metrics(self):
+        # Свободные соединения — список внутри ThreadedConnectionPool
+        DB_POOL_CONNECTIONS.labels("idle").set(len(self._pool._pool))
+
+    def getconn(self):
+        started = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            DB_POOL_TIMEOUTS.inc()
+            raise pg_pool.PoolError("Нет свободных подключений к БД")
+        try:
+            conn = self._pool.getconn()
+            if not self._is_alive(conn):
+                # Битое соединение закрываем, вместо него пул откроет новое
+                self._pool.putconn(conn, close=True)
+                conn = self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+        DB_CONNECT_SECONDS.observe(time.perf_counter() - started)
+        DB_POOL_CONNECTIONS.labels("in_use").inc()
+        self._update_metrics()
+        return conn
+
+    def putconn(self, conn):
+        try:
+            broken = bool(conn.closed)
+            if not broken and conn.autocommit:
+                conn.autocommit = False
+            if not broken and conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    broken = True
+            self._pool.putconn(conn, close=broken)
+        finally:
+            self._slots.release()
+            DB_POOL_CONNECTIONS.labels("in_use").dec()
+            self._update_metrics()
+
+    def closeall(self):
+        self._pool.closeall()
+
+db_pool = None
+_db_pool_lock = threading.Lock()
+
+def init_db_pool():
+    """Создаёт пул подключений, если он ещё не создан"""
+    global db_pool
+    with _db_pool_lock:
+        if db_pool is None:
+            db_pool = DatabasePool(**DB_POOL_CONFIG, **DB_CONFIG, cursor_factory=TimedCursor)
+    return db_pool
+
+def close_db_pool():
+    """Закрывает все подключения пула"""
+    global db_pool
+    with _db_pool_lock:
+        if db_pool is not None:
+            db_pool.closeall()
+            db_pool = None
+
+class RequestConnection:
+    """Соединение, общее для всех хелперов в рамках одного запроса"""
+
+    def __init__(self):
+        self.conn = None
+
+    def acquire(self):
+        if self.conn is None:
+            started = time.perf_counter()
+            self.conn = init_db_pool().getconn()
+            record_connect(time.perf_counter() - started)
+        return self.conn
+
+    def release(self):
+        if self.conn is not None:
+            conn, self.conn = self.conn, None
+            init_db_pool().putconn(conn)
+
+_request_connection = contextvars.ContextVar("request_connection", default=None)
+
+# Шаги, которые выполняются, пока запрос уже держит соединение (чанки потоковых ответов, возврат
+# соединения в пул), идут в отдельных потоках, а не в общем пуле DB_WORKER_THREADS. Владельцев
+# соединений не больше DB_POOL_MAX, поэтому поток им всегда найдётся, даже если все общие потоки
+# ждут соединение в getconn, — иначе такие запросы стоят до DB_POOL_TIMEOUT.
+_holder_limiter = RunVar("connection_holder_limiter")
+
+async def run_holding_connection(func, *args):
+    """run_in_threadpool для кода, выполняемого владельцем соединения из пула"""
+    try:
+        limiter = _holder_limiter.get()
+    except LookupError:
+        limiter = CapacityLimiter(DB_POOL_CONFIG['maxconn'])
+        _holder_limiter.set(limiter)
+    return await to_thread.run_sync(func, *args, limiter=limiter)
+
+def without_request_connection(func, *args):
+    """Выполняет func с собственным соединением, которое возвращается в пул сразу после неё.
+
+    Для проверок в middleware: соединение запроса, взятое в них, держалось бы до обработчика,
+    а тот ждёт свободный поток в общем пуле.
+    """
+    token = _request_connection.set(None)
+    try:
+        return func(*args)
+    finally:
+        _request_connection.reset(token)
+
+class PooledConnection:
+    """Обёртка над соединением из пула: close() возвращает его в пул, а не рвёт TCP"""
+
+    def __init__(self, conn, shared=False):
+        self._conn = conn
+        self._shared = shared
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        if name.startswith("_"):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._conn, name, value)
+
+    def close(self):
+        # Соединение запроса освобождает middleware после ответа
+        if self._shared or self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        init_db_pool().putconn(conn)
+
+class TTLCache:
+    """Потокобезопасный LRU-кэш с ограничением размера и временем жизни записей
+
+    Размер считается в штуках или, если задан weigher, в его единицах (например, байтах).
+    """
+
+    def __init__(self, maxsize, ttl=float("inf"), weigher=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.weigher = weigher
+        self._data = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def _weight(self, value):
+        return self.weigher(value) if self.weigher else 1
+
+    def _remove(self, key):
+        value, _ = self._data.pop(key)
+        self._size -= self._weight(value)
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires = item
+            if expires <= time.monotonic():
+                self._remove(key)
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + (self.ttl if ttl is None else min(ttl, self.ttl))
+        weight = self._weight(value)
+        if weight > self.maxsize:
+            return
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, expires)
+            self._size += weight
+            while self._size > self.maxsize:
+                self._remove(next(iter(self._data)))
+
+    def pop(self, key):
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._size = 0
+
 def get_db_connection():
-    return psycopg2.connect(**DB_CONFIG)
+    scope = _request_connection.get()
+    if scope is not None:
+        return PooledConnection(scope.acquire(), shared=True)
+    started = time.perf_counter()
+    conn = init_db_pool().getconn()
+    record_connect(time.perf_counter() - started)
+    return PooledConnection(conn)
+
+def get_data_versions(tables):
+    """Текущие счётчики изменений таблиц из data_version"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT table_name, version FROM data_version WHERE table_name = ANY(%s);", (list(tables),))
+    versions = dict(cur.fetchall())
+    cur.close()
+    conn.close()
+    return tuple(versions.get(table, 0) for table in tables)
+
+# Кэш HTML-фрагментов: (функция, аргументы) -> (версии таблиц, html), общий лимит в байтах
+fragment_cache = TTLCache(FRAGMENT_CACHE_MAX_BYTES, weigher=lambda item: sys.getsizeof(item[1]))
+
+def etag_tables(*tables, daily=False):
+    """Помечает GET-обработчик: его ответ определяется данными этих таблиц (и текущей датой, если daily)"""
+    def decorator(func):
+        func.etag_tables = tables
+        func.etag_daily = daily
+        return func
+    return decorator
+
+def cached_fragment(*tables):
+    """Кэширует HTML, который строит функция, пока не изменились перечисленные таблицы
+
+    Версии читаются из Postgres до построения, поэтому кэш согласован между воркерами.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (func.__name__, args, tuple(sorted(kwargs.items())))
+            versions = get_data_versions(tables)
+            cached = fragment_cache.get(key)
+            hit = cached is not None and cached[0] == versions
+            record_cache("fragment", hit)
+            if hit:
+                return cached[1]
+            html = func(*args, **kwargs)
+            fragment_cache.set(key, (versions, html))
+            return html
+        return wrapper
+    return decorator
+
+def cached_stream(*tables):
+    """cached_fragment для генераторов HTML: при попадании отдаёт готовый html одним чанком,
+    иначе отдаёт чанки по мере построения и кэширует результат не больше STREAM_CACHE_MAX_BYTES
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (func.__name__, args, tuple(sorted(kwargs.items())))
+            versions = get_data_versions(tables)
+            cached = fragment_cache.get(key)
+            hit = cached is not None and cached[0] == versions
+            record_cache("stream", hit)
+            if hit:
+                yield cached[1]
+                return
+            parts, size = [], 0
+            for chunk in func(*args, **kwargs):
+                yield chunk
+                if parts is not None:
+                    size += len(chunk)
+                    parts.append(chunk)
+                    if size > STREAM_CACHE_MAX_BYTES:
+                        parts = None
+            if parts is not None:
+                fragment_cache.set(key, (versions, "".join(parts)))
+        return wrapper
+    return decorator
+
+def split_template(template, placeholder="rows", **values):
+    """Делит шаблон по {placeholder} на начало и конец, подставляя остальные значения"""
+    head, tail = template.split("{" + placeholder + "}")
+    return head.format(**values), tail.format(**values)
+
+def stream_rows(query, params, render_row):
+    """Выполняет запрос через серверный курсор и отдаёт HTML строк пачками по STREAM_CHUNK_ROWS"""
+    conn = get_db_connection()
+    cur = conn.cursor(name=f"stream_{uuid.uuid4().hex}")
+    try:
+        cur.execute(query, params)
+        while True:
+            rows = cur.fetchmany(STREAM_CHUNK_ROWS)
+            if not rows:
+                break
+            yield "".join(render_row(row) for row in rows)
+    finally:
+        cur.close()
+        conn.close()
+
+class ClosingStreamingResponse(StreamingResponse):
+    """StreamingResponse, который закрывает генератор тела и при обрыве ответа.
+
+    Когда клиент отключается, задача ответа отменяется на отправке, а генератор остаётся
+    на yield — без aclose() его finally (возврат соединения, остановка выгрузки) не выполнится.
+    """
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            with CancelScope(shield=True):
+                await self.body_iterator.aclose()
+
+def stream_html(chunks):
+    """StreamingResponse из генератора HTML-чанков.
+
+    Соединение запроса middleware освобождает до отправки тела, поэтому шаги генератора
+    выполняются в пуле потоков со своим соединением, которое возвращается в пул в конце потока.
+    """
+    async def body():
+        scope = RequestConnection()
+        context = contextvars.copy_context()
+        context.run(_request_connection.set, scope)
+        iterator = iter(chunks)
+        close = getattr(iterator, "close", None)
+        try:
+            while True:
+                # Первый шаг берёт соединение потока в общем пуле потоков, следующие — владелец
+                run = run_holding_connection if scope.conn is not None else run_in_threadpool
+                chunk = await run(context.run, next, iterator, None)
+                if chunk is None:
+                    break
+                if chunk:
+                    yield chunk
+        finally:
+            if close is not None:
+                await run_holding_connection(context.run, close)
+            await run_holding_connection(scope.release)
+    return ClosingStreamingResponse(body(), media_type="text/html")
 
 def hash_password(password: str) -> str:
     """Хеширует пароль с солью"""
@@ -185,72 +754,404 @@ def create_user(username: str, password: str):
     cur.close()
     conn.close()
 
+def remove_duplicates(cur, table, key_columns):
+    """Удаляет дубли по ключу перед созданием уникального индекса, оставляя отмеченную запись"""
+    column_names = {name for name, _ in table_columns(table)}
+    keep_order = ["completed", "id"] if "completed" in column_names else ["id"]
+    cur.execute(sql.SQL("""
+        DELETE FROM {table} a USING {table} b
+        WHERE {same_key} AND ({a_order}) < ({b_order});
+    """).format(
+        table=sql.Identifier(table),
+        same_key=sql.SQL(" AND ").join(
+            sql.SQL("a.{col} = b.{col}").format(col=sql.Identifier(col)) for col in key_columns
+        ),
+        a_order=sql.SQL(", ").join(sql.SQL("a.{}").format(sql.Identifier(col)) for col in keep_order),
+        b_order=sql.SQL(", ").join(sql.SQL("b.{}").format(sql.Identifier(col)) for col in keep_order),
+    ))
+
+def schema_hash():
+    """Хэш описания схемы: при его совпадении с сохранённым интроспекция каталога не нужна"""
+    return hashlib.sha256(repr((SCHEMA_EXTENSIONS, SCHEMA_ENUMS, SCHEMA, VERSIONED_TABLES, LATEST_VERSION)).encode()).hexdigest()
+
+# Ключ advisory lock, чтобы схему обновлял только один воркер
+SCHEMA_LOCK_ID = 0x73636865
+
 def init_db_schema():
+    """Применяет миграции и приводит БД к SCHEMA; если схема не менялась — один запрос"""
     conn = get_db_connection()
     cur = conn.cursor()
+    expected = (LATEST_VERSION, schema_hash())
+    try:
+        if read_schema_state(cur) == expected:
+            conn.rollback()
+            return
+        cur.execute("SELECT pg_advisory_lock(%s);", (SCHEMA_LOCK_ID,))
+        try:
+            # Пока ждали блокировку, схему мог обновить другой воркер
+            version, saved_hash = read_schema_state(cur)
+            if (version, saved_hash) != expected:
+                cur.execute("SET LOCAL lock_timeout = %s;", (SCHEMA_LOCK_TIMEOUT,))
+                sync_schema(cur)
+                applied = apply_migrations(cur, version)
+                conn.commit()
+                if applied:
+                    logger.info("Применены миграции: %s", applied)
+                create_missing_indexes(conn, cur)
+                record_schema_hash(cur, expected[1])
+                conn.commit()
+        finally:
+            conn.rollback()
+            cur.execute("SELECT pg_advisory_unlock(%s);", (SCHEMA_LOCK_ID,))
+            conn.commit()
+    finally:
+        cur.close()
+        conn.close()
 
-    # Создаём ENUM-ы, если их нет
-    create_enum(cur, 'habit_priority_enum', ['HIGH', 'MEDIUM', 'LOW'])
-    create_enum(cur, 'task_repeat_enum', ['NONE', 'DAILY', 'WEEKLY'])
+def sync_schema(cur):
+    """Создаёт недостающие расширения, ENUM-ы, таблицы и столбцы из SCHEMA; лишние не удаляет"""
+    for name in SCHEMA_EXTENSIONS:
+        cur.execute(sql.SQL("CREATE EXTENSION IF NOT EXISTS {};").format(sql.Identifier(name)))
+    for name, values in SCHEMA_ENUMS.items():
+        create_enum(cur, name, values)
 
-    # Получаем все таблицы в public
     cur.execute("""
-        SELECT table_name FROM information_schema.tables WHERE table_schema = 'public';
+        SELECT c.relname, a.attname
+        FROM pg_class c
+        LEFT JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+        WHERE c.relnamespace = 'public'::regnamespace AND c.relkind = 'r';
     """)
-    existing_tables = {row[0] for row in cur.fetchall()}
-    schema_tables = set(SCHEMA.keys())
-
-    # Удаляем лишние таблицы
-    for table in existing_tables - schema_tables:
-        cur.execute(sql.SQL("DROP TABLE IF EXISTS {} CASCADE;").format(sql.Identifier(table)))
-
-    for table, columns in SCHEMA.items():
-        # Проверяем, существует ли таблица
-        cur.execute("""
-            SELECT EXISTS (
-                SELECT FROM information_schema.tables 
-                WHERE table_name = %s
-            );
-        """, (table,))
-        exists = cur.fetchone()[0]
-        if not exists:
+    existing_columns = {}
+    for table, column in cur.fetchall():
+        existing_columns.setdefault(table, set()).add(column)
+
+    # Лишние таблицы и столбцы удаляются только явной миграцией
+    for table in existing_columns.keys() - SCHEMA.keys() - {"schema_version"}:
+        logger.warning("Таблица %s не описана в SCHEMA", table)
+
+    for table in SCHEMA:
+        columns = table_columns(table)
+        if table not in existing_columns:
             # Создаём таблицу
             columns_sql = ", ".join(f"{name} {type}" for name, type in columns)
             cur.execute(sql.SQL("CREATE TABLE {} ({});").format(
                 sql.Identifier(table),
                 sql.SQL(columns_sql)
             ))
-        else:
-            # Проверяем наличие всех нужных столбцов
-            cur.execute("""
-                SELECT column_name FROM information_schema.columns WHERE table_name = %s;
-            """, (table,))
-            existing_columns = {row[0] for row in cur.fetchall()}
-            schema_columns = {name for name, _ in columns}
-            # Удаляем лишние столбцы
-            for col in existing_columns - schema_columns:
-                cur.execute(sql.SQL("ALTER TABLE {} DROP COLUMN IF EXISTS {} CASCADE;").format(
+            continue
+        schema_columns = {name for name, _ in columns}
+        for col in existing_columns[table] - schema_columns:
+            logger.warning("Столбец %s.%s не описан в SCHEMA", table, col)
+        # Добавляем недостающие столбцы
+        for name, type in columns:
+            if name not in existing_columns[table]:
+                backfill = COLUMN_BACKFILL.get((table, name))
+                cur.execute(sql.SQL("ALTER TABLE {} ADD COLUMN {} {};").format(
                     sql.Identifier(table),
-                    sql.Identifier(col)
+                    sql.Identifier(name),
+                    sql.SQL(type.replace(" NOT NULL", "") if backfill else type)
                 ))
-            # Добавляем недостающие столбцы
-            for name, type in columns:
-                if name not in existing_columns:
-                    cur.execute(sql.SQL("ALTER TABLE {} ADD COLUMN {} {};").format(
-                        sql.Identifier(table),
-                        sql.Identifier(name),
-                        sql.SQL(type)
-                    ))
+                if backfill:
+                    # Сначала заполняем имеющиеся строки, потом включаем NOT NULL
+                    expression, params = backfill
+                    cur.execute(sql.SQL("UPDATE {table} SET {column} = " + expression + ";").format(
+                        table=sql.Identifier(table), column=sql.Identifier(name)), params)
+                    cur.execute(sql.SQL("ALTER TABLE {} ALTER COLUMN {} SET NOT NULL;").format(
+                        sql.Identifier(table), sql.Identifier(name)))
+
+    # Триггеры, увеличивающие счётчик таблицы в data_version при любой записи. Счётчик меняется в той же
+    # транзакции, что и данные: отдельная транзакция после коммита при сбое между ними оставила бы кэш
+    # устаревшим навсегда, а записи в обход приложения (CLI, psql) не увеличивали бы его вовсе. Цена —
+    # блокировка строки таблицы в data_version от конца оператора до коммита: одновременные записи в одну
+    # таблицу выстраиваются в очередь на коммит. Транзакции обработчиков короткие, записи в разные таблицы
+    # не конфликтуют — для личного календаря это приемлемо
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION bump_data_version() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO data_version (table_name, version) VALUES (TG_TABLE_NAME, 1)
+            ON CONFLICT (table_name) DO UPDATE SET version = data_version.version + 1;
+            RETURN NULL;
+        END$$ LANGUAGE plpgsql;
+    """)
+    for table in VERSIONED_TABLES:
+        cur.execute(sql.SQL("""
+            CREATE OR REPLACE TRIGGER {trigger} AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+            FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version();
+        """).format(trigger=sql.Identifier(f"{table}_data_version"), table=sql.Identifier(table)))
+
+def create_missing_indexes(conn, cur):
+    """Создаёт объявленные в SCHEMA индексы через CONCURRENTLY, не блокируя запись в таблицы"""
+    cur.execute("""
+        SELECT c.relname, i.indisvalid
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relnamespace = 'public'::regnamespace;
+    """)
+    existing_indexes = dict(cur.fetchall())
+    conn.commit()
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+    conn.autocommit = True
+    try:
+        for table in SCHEMA:
+            for index in table_indexes(table):
+                if existing_indexes.get(index.name):
+                    continue
+                if index.name in existing_indexes:
+                    # Невалидный индекс остаётся после прерванной сборки — пересоздаём
+                    cur.execute(sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {};").format(sql.Identifier(index.name)))
+                if index.unique:
+                    remove_duplicates(cur, table, index.columns)
+                cur.execute(sql.SQL("CREATE {unique}INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} USING {using} ({columns}){where};").format(
+                    unique=sql.SQL("UNIQUE " if index.unique else ""),
+                    name=sql.Identifier(index.name),
+                    table=sql.Identifier(table),
+                    using=sql.SQL(index.using),
+                    columns=sql.SQL(", ").join(map(sql.SQL, index.columns)),
+                    where=sql.SQL(f" WHERE {index.where}" if index.where else ""),
+                ))
+    finally:
+        conn.autocommit = False
+
+def current_date():
+    """Сегодняшняя дата в часовом поясе приложения"""
+    return datetime.now(APP_TIMEZONE).date()
+
+# Ключ advisory lock, чтобы rollover выполнял только один воркер
+ROLLOVER_LOCK_ID = 0x726F6C6C
+
+def run_daily_rollover(day=None):
+    """Создаёт записи habit_entry и task_entry на день, догоняя пропущенные после простоя дни"""
+    day = day or current_date()
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT pg_try_advisory_xact_lock(%s);", (ROLLOVER_LOCK_ID,))
+        if not cur.fetchone()[0]:
+            # Этот день уже обрабатывает другой воркер
+            conn.rollback()
+            return False
+        cur.execute("SELECT MAX(day) FROM daily_rollover;")
+        last_day = cur.fetchone()[0]
+        if last_day is not None and last_day >= day:
+            conn.rollback()
+            return False
+        first_day = day
+        if last_day is not None:
+            first_day = max(last_day + timedelta(days=1), day - timedelta(days=TASK_BACKFILL_DAYS))
+        started = time.monotonic()
+        habit_entries = materialize_habit_entries(cur, day, first_day)
+        advance_habit_stats(cur, day)
+        task_entries = materialize_task_entries(cur, day)
+        duration_ms = int((time.monotonic() - started) * 1000)
+        cur.execute(
+            "INSERT INTO daily_rollover (day, habit_entries, task_entries, duration_ms) VALUES (%s, %s, %s, %s);",
+            (day, habit_entries, task_entries, duration_ms)
+        )
+        conn.commit()
+        ROLLOVER_DURATION.observe(duration_ms / 1000)
+        ROLLOVER_LAST_SUCCESS.set_to_current_time()
+        logger.info("Rollover %s: habit_entry +%s, task_entry +%s, %s ms", day, habit_entries, task_entries, duration_ms)
+        return True
+    finally:
+        cur.close()
+        conn.close()
+
+def ensure_habit_stats():
+    """Строит сводку habit_stats для привычек, у которых её ещё нет (первый запуск после обновления)"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        built = rebuild_habit_stats(cur, current_date(), missing_only=True)
+        conn.commit()
+        if built:
+            logger.info("Построена сводка привычек: %s", built)
+    finally:
+        cur.close()
+        conn.close()
+
+def ensure_nutrition_daily():
+    """Строит сводку питания, если её ещё нет, а приёмы пищи уже есть (первый запуск после обновления)"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT NOT EXISTS (SELECT 1 FROM nutrition_daily) AND EXISTS (SELECT 1 FROM meal_log);")
+        if cur.fetchone()[0]:
+            days = rebuild_nutrition_daily(cur)
+            conn.commit()
+            logger.info("Построена сводка питания, дней: %s", days)
+    finally:
+        cur.close()
+        conn.close()
+
+def seconds_until_rollover():
+    """Секунды до ближайшей полуночи в часовом поясе приложения плюс задержка"""
+    now = datetime.now(APP_TIMEZONE)
+    midnight = datetime.combine(now.date() + timedelta(days=1), dt_time.min, tzinfo=APP_TIMEZONE)
+    return max((midnight - now).total_seconds(), 0) + ROLLOVER_DELAY_SECONDS
+
+async def daily_rollover_loop():
+    delay = seconds_until_rollover()
+    while True:
+        await asyncio.sleep(delay)
+        try:
+            await run_in_threadpool(run_daily_rollover)
+            delay = seconds_until_rollover()
+        except Exception:
+            ROLLOVER_FAILURES.inc()
+            logger.exception("Не удалось создать записи нового дня")
+            delay = ROLLOVER_RETRY_SECONDS
+
+def sweep_expired_sessions():
+    """Удаляет просроченные сессии"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("DELETE FROM sessions WHERE expires_at <= LOCALTIMESTAMP;")
+    deleted = cur.rowcount
     conn.commit()
     cur.close()
     conn.close()
+    return deleted
+
+async def session_sweep_loop():
+    while True:
+        await asyncio.sleep(SESSION_SWEEP_SECONDS)
+        try:
+            await run_in_threadpool(sweep_expired_sessions)
+        except Exception:
+            logger.exception("Не удалось удалить просроченные сессии")
+
+background_tasks = []
 
 @app.on_event("startup")
 def on_startup():
+    to_thread.current_default_thread_limiter().total_tokens = DB_WORKER_THREADS
+    load_asset_manifest()
+    init_db_pool()
     init_db_schema()
+    init_metrics(get_db_connection)
+    # Догоняем дни, пропущенные, пока приложение не работало
+    run_daily_rollover()
+    ensure_habit_stats()
+    ensure_nutrition_daily()
+
+@app.on_event("startup")
+async def start_background_tasks():
+    background_tasks.append(asyncio.create_task(daily_rollover_loop()))
+    background_tasks.append(asyncio.create_task(session_sweep_loop()))
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    for task in background_tasks:
+        task.cancel()
+    background_tasks.clear()
+
+@app.on_event("shutdown")
+def on_shutdown():
+    close_db_pool()
+    mark_process_dead()
+
+def find_endpoint(scope):
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            # Маршрут нужен метрикам и тогда, когда ответ 304 отдаётся без роутера
+            scope.setdefault("route", route)
+            return getattr(route, "endpoint", None)
+    return None
+
+@app.middleware("http")
+async def conditional_get(request: Request, call_next):
+    # ETag из версий данных: если у клиента актуальная копия — 304 без построения HTML
+    endpoint = find_endpoint(request.scope) if request.method == "GET" else None
+    tables = getattr(endpoint, "etag_tables", None)
+    if tables is None:
+        return await call_next(request)
+    versions = await run_in_threadpool(without_request_connection, get_data_versions, tables)
+    day = current_date().isoformat() if endpoint.etag_daily else ""
+    digest = hashlib.sha256(repr((BUILD_ID, request.url.path, request.url.query, versions, day)).encode())
+    etag = f'"{digest.hexdigest()[:32]}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Cookie"}
+    # Сжатие дописывает к ETag кодировку ("...-br"): сравниваем без неё, а в 304 возвращаем тег клиента
+    # целиком — тот же, что пришёл с ответом 200
+    client_tags = {}
+    for tag in request.headers.get("if-none-match", "").split(","):
+        tag = tag.strip()
+        client_tags.setdefault(tag.split("-")[0].rstrip('"') + '"', tag)
+    record_cache("etag", etag in client_tags)
+    if etag in client_tags:
+        return Response(status_code=304, headers={**headers, "ETag": client_tags[etag]})
+    response = await call_next(request)
+    if response.status_code == 200:
+        response.headers.update(headers)
+    return response
+
+@app.middleware("http")
+async def require_session(request: Request, call_next):
+    # Разделы приложения доступны только с активной сессией; проверка обычно попадает в кэш
+    if request.url.path.startswith("/section/"):
+        token = request.cookies.get("session_token")
+        user = session_cache.get(token) if token else None
+        if token:
+            record_cache("session", user is not None)
+        if user is None and token:
+            user = await run_in_threadpool(without_request_connection, get_user_by_session_token, token)
+        if user is None:
+            return Response(status_code=401, headers={"HX-Redirect": "/"})
+        request.state.user = user
+    return await call_next(request)
+
+@app.middleware("http")
+async def request_db_connection(request: Request, call_next):
+    # Одно соединение из пула на запрос, возвращается в пул после ответа
+    scope = RequestConnection()
+    token = _request_connection.set(scope)
+    try:
+        return await call_next(request)
+    finally:
+        _request_connection.reset(token)
+        if scope.conn is not None:
+            await run_holding_connection(scope.release)
+
+def request_route(request):
+    """Метка маршрута для метрик — шаблон пути, чтобы id в URL не плодили ряды"""
+    return getattr(request.scope.get("route"), "path", "unmatched")
+
+@app.middleware("http")
+async def request_timing(request: Request, call_next):
+    # Замеры запроса: Server-Timing — к моменту заголовков, строка лога — после всего тела
+    stats = RequestStats()
+    token = request_stats.set(stats)
+    REQUESTS_IN_PROGRESS.inc()
+    try:
+        response = await call_next(request)
+    except Exception:
+        REQUESTS_IN_PROGRESS.dec()
+        # Необработанное исключение станет 500 — такие запросы тоже попадают в лог
+        log_request(request.method, request.url.path, 500, stats)
+        observe_request(request.method, request_route(request), 500, stats)
+        raise
+    finally:
+        request_stats.reset(token)
+    if SERVER_TIMING:
+        response.headers["Server-Timing"] = stats.server_timing()
+    body = response.body_iterator
+
+    async def logged_body():
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            REQUESTS_IN_PROGRESS.dec()
+            log_request(request.method, request.url.path, response.status_code, stats)
+            observe_request(request.method, request_route(request), response.status_code, stats)
+    response.body_iterator = logged_body()
+    return response
+
+# Сжатие — самый внешний слой, поэтому добавляется после остальных middleware
+app.add_middleware(CompressionMiddleware)
 
 @app.get("/", response_class=HTMLResponse)
-async def index(request: Request, session_token: str = Cookie(None)):
+def index(request: Request, session_token: str = Cookie(None)):
     # Если есть активная сессия — редиректим на /app
     user = get_user_by_session_token(session_token)
     if user:
@@ -268,7 +1169,7 @@ async def index(request: Request, session_token: str = Cookie(None)):
         return HTMLResponse(content=html_content)
 
 @app.post("/register", response_class=HTMLResponse)
-async def register(username: str = Form(...), password: str = Form(...)):
+def register(username: str = Form(...), password: str = Form(...)):
     if check_user_exists():
         return HTMLResponse("<div class='error' style='color:red;text-align:center;margin-bottom:16px;'>Регистрация уже завершена</div>", status_code=400)
     if len(username) < 3:
@@ -284,7 +1185,7 @@ async def register(username: str = Form(...), password: str = Form(...)):
         return HTMLResponse(f"<div class='error' style='color:red;text-align:center;margin-bottom:16px;'>Ошибка при создании пользователя: {str(e)}</div>", status_code=500)
 
 @app.post("/login", response_class=HTMLResponse)
-async def login(username: str = Form(...), password: str = Form(...)):
+def login(username: str = Form(...), password: str = Form(...)):
     user = get_user_by_username(username)
     if not user or not verify_password(password, user[2]):
         return HTMLResponse(
@@ -294,11 +1195,11 @@ async def login(username: str = Form(...), password: str = Form(...)):
     # Успешный вход — создаём сессию и устанавливаем cookie
     token = create_session(user[0])
     response = HTMLResponse(headers={"HX-Redirect": "/app"})
-    response.set_cookie("session_token", token, httponly=True)
+    response.set_cookie("session_token", token, httponly=True, max_age=SESSION_LIFETIME_DAYS * 86400)
     return response
 
 @app.get("/app", response_class=HTMLResponse)
-async def app_main(request: Request, session_token: str = Cookie(None)):
+def app_main(request: Request, session_token: str = Cookie(None)):
     user = get_user_by_session_token(session_token)
     if not user:
         return RedirectResponse("/")
@@ -367,6 +1268,7 @@ HABIT_CATEGORY_EDIT_TEMPLATE = '''
 </tr>
 '''
 
+@cached_fragment("habit_category")
 def render_habit_category_list():
     conn = get_db_connection()
     cur = conn.cursor()
@@ -396,55 +1298,48 @@ function setActiveSubTab(tab) {{
 '''
 
 @app.get("/section/habits", response_class=HTMLResponse)
-async def section_habits():
+@etag_tables("habit", "habit_entry", "habit_stats", daily=True)
+def section_habits():
     # При нажатии на корневую вкладку всегда показываем актуальный раздел "Отметки"
-    content = (await habits_marks()).body.decode()
-    html = HABITS_SECTION_TEMPLATE.format(
+    head, tail = split_template(
+        HABITS_SECTION_TEMPLATE, "content",
         active_marks="active", active_categories="", active_habits="",
-        content=content
     )
-    return HTMLResponse(html)
-
-@app.get("/section/habits/marks", response_class=HTMLResponse)
-async def habits_marks():
-    today = date.today()
-    conn = get_db_connection()
-    cur = conn.cursor()
-    # Получаем все привычки
-    cur.execute("SELECT id, name FROM habit ORDER BY name;")
-    habits = cur.fetchall()
-    # Проверяем, есть ли записи habit_entry на сегодня для каждой привычки
-    for habit_id, _ in habits:
-        cur.execute("SELECT 1 FROM habit_entry WHERE habit_id = %s AND date = %s;", (habit_id, today))
-        if not cur.fetchone():
-            cur.execute(
-                "INSERT INTO habit_entry (id, habit_id, date, completed) VALUES (%s, %s, %s, %s);",
-                (str(uuid.uuid4()), habit_id, today, False)
-            )
-    conn.commit()
-    # Получаем все записи habit_entry на сегодня с названиями привычек
+    def chunks():
+        yield head
+        yield from render_habits_marks()
+        yield tail
+    return stream_html(chunks())
+
+def materialize_habit_entries(cur, day, first_day=None):
+    """Создаёт записи habit_entry за дни с first_day по day для всех привычек, у которых их ещё нет"""
     cur.execute('''
-        SELECT e.id, h.name, e.completed
-        FROM habit_entry e JOIN habit h ON e.habit_id = h.id
-        WHERE e.date = %s
-        ORDER BY h.name;
-    ''', (today,))
-    rows = ""
-    for entry_id, habit_name, completed in cur.fetchall():
-        checked = "checked" if completed else ""
-        row_class = ' class="bg-green-100"' if completed else ''
-        rows += f'''<tr{row_class}><td class="border border-slate-300 p-2">{habit_name}</td><td class="border border-slate-300 p-2 cursor-pointer" hx-post="/section/habits/marks/toggle/{entry_id}" hx-target="#habits-marks-table-area" hx-swap="outerHTML"><input type="checkbox" {checked} class="pointer-events-none"></td></tr>'''
-    cur.close()
-    conn.close()
-    html = f'''
+        INSERT INTO habit_entry (id, habit_id, date, completed)
+        SELECT gen_random_uuid(), h.id, d::date, FALSE
+        FROM habit h CROSS JOIN generate_series(%s::date, %s::date, interval '1 day') d
+        ON CONFLICT (habit_id, date) DO NOTHING;
+    ''', (first_day or day, day))
+    return cur.rowcount
+
+def render_habit_mark_row(entry_id, habit_name, completed, *stats):
+    checked = "checked" if completed else ""
+    row_class = ' class="bg-green-100"' if completed else ''
+    current_streak, longest_streak, rates = summarize(stats, current_date())
+    streak = f"{current_streak} / {longest_streak}" if current_streak is not None else "—"
+    rates = " / ".join(f"{rates[w]:.0%}" if rates[w] is not None else "—" for w in STATS_WINDOWS)
+    return f'''<tr{row_class}><td class="border border-slate-300 p-2">{habit_name}</td><td class="border border-slate-300 p-2 cursor-pointer" hx-post="/section/habits/marks/toggle/{entry_id}" hx-target="closest tr" hx-swap="outerHTML"><input type="checkbox" {checked} class="pointer-events-none"></td><td class="border border-slate-300 p-2 text-center">{streak}</td><td class="border border-slate-300 p-2 text-center whitespace-nowrap">{rates}</td></tr>'''
+
+HABITS_MARKS_TEMPLATE = '''
     <div id="habits-marks-table-area">
-        <h2 class="text-xl lg:text-2xl font-bold mb-4">Отметки за {today.strftime('%d.%m.%Y')}</h2>
+        <h2 class="text-xl lg:text-2xl font-bold mb-4">Отметки за {today}</h2>
         <div class="responsive-table">
         <table id="habits-marks-table" class="table-auto w-full border-collapse border border-slate-400">
             <thead>
                 <tr>
                     <th class="border border-slate-300 p-2">Привычка</th>
                     <th class="border border-slate-300 p-2">Выполнено</th>
+                    <th class="border border-slate-300 p-2">Серия: текущая / лучшая</th>
+                    <th class="border border-slate-300 p-2">За 7 / 30 / 365 дней</th>
                 </tr>
             </thead>
             <tbody>
@@ -454,29 +1349,50 @@ async def habits_marks():
         </div>
     </div>
     '''
-    return HTMLResponse(html)
+
+def render_habits_marks():
+    # Записи на сегодня заранее создаёт суточный rollover, здесь только чтение
+    today = current_date()
+    head, tail = split_template(HABITS_MARKS_TEMPLATE, today=today.strftime('%d.%m.%Y'))
+    yield head
+    # Все записи habit_entry на сегодня с названиями привычек и готовой сводкой серий
+    yield from stream_rows(f'''
+        SELECT e.id, h.name, e.completed, s.*
+        FROM habit_entry e JOIN habit h ON e.habit_id = h.id
+        LEFT JOIN LATERAL (SELECT {STATS_COLUMNS} FROM habit_stats WHERE habit_id = e.habit_id) s ON TRUE
+        WHERE e.date = %s
+        ORDER BY h.name;
+    ''', (today,), lambda row: render_habit_mark_row(*row))
+    yield tail
+
+@app.get("/section/habits/marks", response_class=HTMLResponse)
+@etag_tables("habit", "habit_entry", "habit_stats", daily=True)
+def habits_marks():
+    return stream_html(render_habits_marks())
 
 @app.post("/section/habits/marks/toggle/{entry_id}", response_class=HTMLResponse)
-async def toggle_habit_entry(entry_id: str):
+def toggle_habit_entry(entry_id: str):
     conn = get_db_connection()
     cur = conn.cursor()
-    # Получаем текущее значение
-    cur.execute("SELECT completed FROM habit_entry WHERE id = %s;", (entry_id,))
+    # Переключаем отметку одним запросом, в той же транзакции обновляем сводку и возвращаем только изменённую строку
+    cur.execute('''
+        UPDATE habit_entry e SET completed = NOT e.completed
+        FROM habit h
+        WHERE e.id = %s AND h.id = e.habit_id
+        RETURNING e.id, h.name, e.completed, e.habit_id, e.date;
+    ''', (entry_id,))
     row = cur.fetchone()
-    if not row:
-        cur.close()
-        conn.close()
-        return HTMLResponse("")
-    new_value = not row[0]
-    cur.execute("UPDATE habit_entry SET completed = %s WHERE id = %s;", (new_value, entry_id))
+    stats = apply_habit_toggle(cur, row[3], row[4], row[2], current_date()) if row else None
     conn.commit()
     cur.close()
     conn.close()
-    # Возвращаем всю таблицу
-    return await habits_marks()
+    if not row:
+        return HTMLResponse("")
+    return HTMLResponse(render_habit_mark_row(*row[:3], *stats))
 
 @app.get("/section/habits/categories", response_class=HTMLResponse)
-async def habits_categories():
+@etag_tables("habit_category")
+def habits_categories():
     html = render_habit_category_list()
     return HTMLResponse(html)
 
@@ -556,6 +1472,7 @@ HABIT_EDIT_TEMPLATE = '''
 </tr>
 '''
 
+@cached_fragment("habit_category")
 def get_habit_category_options(selected=None):
     conn = get_db_connection()
     cur = conn.cursor()
@@ -568,6 +1485,7 @@ def get_habit_category_options(selected=None):
     conn.close()
     return options
 
+@cached_fragment("habit", "habit_category")
 def render_habit_list():
     conn = get_db_connection()
     cur = conn.cursor()
@@ -586,11 +1504,12 @@ def render_habit_list():
     return HABIT_LIST_TEMPLATE.format(rows=rows, category_options=get_habit_category_options())
 
 @app.get("/section/habits/habits", response_class=HTMLResponse)
-async def habits_habits():
+@etag_tables("habit", "habit_category")
+def habits_habits():
     return HTMLResponse(render_habit_list())
 
 @app.post("/section/habits/habits/add", response_class=HTMLResponse)
-async def add_habit(
+def add_habit(
     name: str = Form(...),
     description: str = Form(None),
     category_id: str = Form(...),
@@ -598,17 +1517,22 @@ async def add_habit(
 ):
     conn = get_db_connection()
     cur = conn.cursor()
+    habit_id = str(uuid.uuid4())
     cur.execute(
         "INSERT INTO habit (id, name, description, category_id, priority) VALUES (%s, %s, %s, %s, %s);",
-        (str(uuid.uuid4()), name, description, category_id, priority)
+        (habit_id, name, description, category_id, priority)
     )
+    # Новая привычка сразу появляется в отметках за сегодня
+    materialize_habit_entries(cur, current_date())
+    rebuild_habit_stats(cur, current_date(), habit_id)
     conn.commit()
     cur.close()
     conn.close()
     return render_habit_list()
 
 @app.get("/section/habits/habits/edit/{habit_id}", response_class=HTMLResponse)
-async def edit_habit_form(habit_id: str):
+@etag_tables("habit", "habit_category")
+def edit_habit_form(habit_id: str):
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute("SELECT id, name, description, category_id, priority FROM habit WHERE id = %s;", (habit_id,))
@@ -624,7 +1548,7 @@ async def edit_habit_form(habit_id: str):
     )
 
 @app.post("/section/habits/habits/edit/{habit_id}", response_class=HTMLResponse)
-async def edit_habit(habit_id: str, name: str = Form(...), description: str = Form(None), category_id: str = Form(...), priority: str = Form(...)):
+def edit_habit(habit_id: str, name: str = Form(...), description: str = Form(None), category_id: str = Form(...), priority: str = Form(...)):
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute(
@@ -637,9 +1561,11 @@ async def edit_habit(habit_id: str, name: str = Form(...), description: str = Fo
     return render_habit_list()
 
 @app.delete("/section/habits/habits/delete/{habit_id}", response_class=HTMLResponse)
-async def delete_habit(habit_id: str):
+def delete_habit(habit_id: str):
     conn = get_db_connection()
     cur = conn.cursor()
+    # Отметки ссылаются на привычку без каскада — удаляем их первыми
+    cur.execute("DELETE FROM habit_entry WHERE habit_id = %s;", (habit_id,))
     cur.execute("DELETE FROM habit WHERE id = %s;", (habit_id,))
     conn.commit()
     cur.close()
@@ -647,7 +1573,7 @@ async def delete_habit(habit_id: str):
     return render_habit_list()
 
 @app.post("/section/habits/category/add", response_class=HTMLResponse)
-async def add_habit_category(name: str = Form(...)):
+def add_habit_category(name: str = Form(...)):
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute("INSERT INTO habit_category (id, name) VALUES (%s, %s);", (str(uuid.uuid4()), name))
@@ -657,7 +1583,8 @@ async def add_habit_category(name: str = Form(...)):
     return render_habit_category_list()
 
 @app.get("/section/habits/category/edit/{cat_id}", response_class=HTMLResponse)
-async def edit_habit_category_form(cat_id: str):
+@etag_tables("habit_category")
+def edit_habit_category_form(cat_id: str):
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute("SELECT id, name FROM habit_category WHERE id = %s;", (cat_id,))
@@ -669,7 +1596,7 @@ async def edit_habit_category_form(cat_id: str):
     return HABIT_CATEGORY_EDIT_TEMPLATE.format(id=row[0], name=row[1])
 
 @app.post("/section/habits/category/edit/{cat_id}", response_class=HTMLResponse)
-async def edit_habit_category(cat_id: str, name: str = Form(...)):
+def edit_habit_category(cat_id: str, name: str = Form(...)):
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute("UPDATE habit_category SET name = %s WHERE id = %s;", (name, cat_id))
@@ -679,7 +1606,7 @@ async def edit_habit_category(cat_id: str, name: str = Form(...)):
     return render_habit_category_list()
 
 @app.delete("/section/habits/category/delete/{cat_id}", response_class=HTMLResponse)
-async def delete_habit_category(cat_id: str):
+def delete_habit_category(cat_id: str):
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute("DELETE FROM habit_category WHERE id = %s;", (cat_id,))
@@ -689,7 +1616,8 @@ async def delete_habit_category(cat_id: str):
     return render_habit_category_list()
 
 @app.get("/section/habits/category/row/{cat_id}", response_class=HTMLResponse)
-async def habit_category_row(cat_id: str):
+@etag_tables("habit_category")
+def habit_category_row(cat_id: str):
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute("SELECT id, name FROM habit_category WHERE id = %s", (cat_id,))
@@ -719,8 +1647,9 @@ function setActiveSubTab(tab) {{
 '''
 
 @app.get("/section/tasks", response_class=HTMLResponse)
-async def section_tasks():
-    content = (await tasks_marks()).body.decode()
+@etag_tables("task", "task_entry", daily=True)
+def section_tasks():
+    content = tasks_marks().body.decode()
     html = TASKS_SECTION_TEMPLATE.format(
         active_marks="active", active_categories="", active_tasks="",
         content=content
@@ -778,6 +1707,7 @@ TASK_CATEGORY_EDIT_TEMPLATE = '''
 </tr>
 '''
 
+@cached_fragment("task_category")
 def render_task_category_list():
     conn = get_db_connection()
     cur = conn.cursor()
@@ -790,11 +1720,12 @@ def render_task_category_list():
     return TASK_CATEGORY_LIST_TEMPLATE.format(rows=rows)
 
 @app.get("/section/tasks/categories", response_class=HTMLResponse)
-async def tasks_categories():
+@etag_tables("task_category")
+def tasks_categories():
     return HTMLResponse(render_task_category_list())
 
 @app.post("/section/tasks/categories/add", response_class=HTMLResponse)
-async def add_task_category(name: str = Form(...)):
+def add_task_category(name: str = Form(...)):
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute("INSERT INTO task_category (id, name) VALUES (%s, %s);", (str(uuid.uuid4()), name))
@@ -804,7 +1735,8 @@ async def add_task_category(name: str = Form(...)):
     return render_task_category_list()
 
 @app.get("/section/tasks/categories/edit/{cat_id}", response_class=HTMLResponse)
-async def edit_task_category_form(cat_id: str):
+@etag_tables("task_category")
+def edit_task_category_form(cat_id: str):
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute("SELECT id, name FROM task_category WHERE id = %s;", (cat_id,))
@@ -816,7 +1748,7 @@ async def edit_task_category_form(cat_id: str):
     return TASK_CATEGORY_EDIT_TEMPLATE.format(id=row[0], name=row[1])
 
 @app.post("/section/tasks/categories/edit/{cat_id}", response_class=HTMLResponse)
-async def edit_task_category(cat_id: str, name: str = Form(...)):
+def edit_task_category(cat_id: str, name: str = Form(...)):
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute("UPDATE task_category SET name = %s WHERE id = %s;", (name, cat_id))
@@ -826,7 +1758,7 @@ async def edit_task_category(cat_id: str, name: str = Form(...)):
     return render_task_category_list()
 
 @app.delete("/section/tasks/categories/delete/{cat_id}", response_class=HTMLResponse)
-async def delete_task_category(cat_id: str):
+def delete_task_category(cat_id: str):
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute("DELETE FROM task_category WHERE id = %s;", (cat_id,))
@@ -836,7 +1768,8 @@ async def delete_task_category(cat_id: str):
     return render_task_category_list()
 
 @app.get("/section/tasks/categories/row/{cat_id}", response_class=HTMLResponse)
-async def task_category_row(cat_id: str):
+@etag_tables("task_category")
+def task_category_row(cat_id: str):
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute("SELECT id, name FROM task_category WHERE id = %s", (cat_id,))
@@ -927,6 +1860,7 @@ TASK_EDIT_TEMPLATE = '''
 </tr>
 '''
 
+@cached_fragment("task_category")
 def get_task_category_options(selected=None):
     conn = get_db_connection()
     cur = conn.cursor()
@@ -939,6 +1873,7 @@ def get_task_category_options(selected=None):
     conn.close()
     return options
 
+@cached_fragment("task", "task_category")
 def render_task_list():
     conn = get_db_connection()
     cur = conn.cursor()
@@ -957,11 +1892,12 @@ def render_task_list():
     return TASK_LIST_TEMPLATE.format(rows=rows, category_options=get_task_category_options())
 
 @app.get("/section/tasks/tasks", response_class=HTMLResponse)
-async def tasks_tasks():
+@etag_tables("task", "task_category")
+def tasks_tasks():
     return HTMLResponse(render_task_list())
 
 @app.post("/section/tasks/tasks/add", response_class=HTMLResponse)
-async def add_task(
+def add_task(
     name: str = Form(...),
     description: str = Form(None),
     category_id: str = Form(...),
@@ -974,13 +1910,16 @@ async def add_task(
         "INSERT INTO task (id, name, description, category_id, date, repeat) VALUES (%s, %s, %s, %s, %s, %s);",
         (str(uuid.uuid4()), name, description, category_id, date, repeat)
     )
+    # Новая задача сразу появляется в отметках, если уже наступила
+    materialize_task_entries(cur, current_date())
     conn.commit()
     cur.close()
     conn.close()
     return render_task_list()
 
 @app.get("/section/tasks/tasks/edit/{task_id}", response_class=HTMLResponse)
-async def edit_task_form(task_id: str):
+@etag_tables("task", "task_category")
+def edit_task_form(task_id: str):
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute("SELECT id, name, description, category_id, date, repeat FROM task WHERE id = %s;", (task_id,))
@@ -996,114 +1935,115 @@ async def edit_task_form(task_id: str):
     )
 
 @app.post("/section/tasks/tasks/edit/{task_id}", response_class=HTMLResponse)
-async def edit_task(task_id: str, name: str = Form(...), description: str = Form(None), category_id: str = Form(...), date: str = Form(...), repeat: str = Form(...)):
+def edit_task(task_id: str, name: str = Form(...), description: str = Form(None), category_id: str = Form(...), date: str = Form(...), repeat: str = Form(...)):
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute(
         "UPDATE task SET name = %s, description = %s, category_id = %s, date = %s, repeat = %s WHERE id = %s;",
         (name, description, category_id, date, repeat, task_id)
     )
+    # Дата или повтор могли измениться — досоздаём положенные записи
+    materialize_task_entries(cur, current_date())
     conn.commit()
     cur.close()
     conn.close()
     return render_task_list()
 
 @app.delete("/section/tasks/tasks/delete/{task_id}", response_class=HTMLResponse)
-async def delete_task(task_id: str):
+def delete_task(task_id: str):
     conn = get_db_connection()
     cur = conn.cursor()
+    # Отметки ссылаются на задачу без каскада — удаляем их первыми
+    cur.execute("DELETE FROM task_entry WHERE task_id = %s;", (task_id,))
     cur.execute("DELETE FROM task WHERE id = %s;", (task_id,))
     conn.commit()
     cur.close()
     conn.close()
     return render_task_list()
 
+def render_task_mark_row(entry_id, name, description, task_date, repeat, entry_date, completed, today, show_completed):
+    checked = "checked" if completed else ""
+    is_overdue = not completed and entry_date < today
+    row_class = ' class="bg-green-100"' if completed else (' class="bg-red-100"' if is_overdue else '')
+    delete_btn = f'<button class="bg-red-500 hover:bg-red-700 text-white font-bold py-1 px-2 rounded mobile-btn" hx-delete="/section/tasks/marks/delete/{entry_id}" hx-target="closest tr" hx-swap="outerHTML">🗑️</button>' if show_completed == "1" else ""
+    last_col = f'<td class="border border-slate-300 p-2">{delete_btn}</td>' if show_completed == "1" else ""
+    return f'''<tr{row_class}><td class="border border-slate-300 p-2">{name}</td><td class="border border-slate-300 p-2">{description or ''}</td><td class="border border-slate-300 p-2">{task_date}</td><td class="border border-slate-300 p-2">{repeat}</td><td class="border border-slate-300 p-2">{entry_date}</td><td class="border border-slate-300 p-2 cursor-pointer" hx-post="/section/tasks/marks/toggle/{entry_id}?show_completed={show_completed}" hx-target="closest tr" hx-swap="outerHTML"><input type="checkbox" {checked} class="pointer-events-none"></td>{last_col}</tr>'''
+
+def parse_task_history_cursor(cursor):
+    """Курсор страницы "дата_id" -> (date, str(UUID)); None для первой страницы"""
+    if not cursor:
+        return None
+    try:
+        entry_date, entry_id = cursor.split("_", 1)
+        return date.fromisoformat(entry_date), str(uuid.UUID(entry_id))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+
+def render_task_marks_page(show_completed, days, cursor=None):
+    """Строки одной страницы отметок задач и, если есть продолжение, строка-загрузчик следующей.
+    Keyset-пагинация: следующая страница начинается после (date, id) последней строки,
+    поэтому запрос читает из индекса только page_size + 1 строк на любой глубине истории"""
+    today = current_date()
+    conditions, params = [], []
+    if show_completed != "1":
+        conditions.append("e.completed = FALSE")
+    if days > 0:
+        conditions.append("e.date > %s")
+        params.append(today - timedelta(days=days))
+    # Открытые задачи — от самых старых (просроченные сверху), история — от новых к старым
+    order = "ASC" if show_completed != "1" else "DESC"
+    if cursor:
+        conditions.append("(e.date, e.id) > (%s, %s)" if order == "ASC" else "(e.date, e.id) < (%s, %s)")
+        params.extend(cursor)
+    where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(f'''
+        SELECT e.id, t.name, t.description, t.date, t.repeat, e.date, e.completed
+        FROM task_entry e
+        JOIN task t ON e.task_id = t.id
+        {where}
+        ORDER BY e.date {order}, e.id {order}
+        LIMIT %s
+    ''', params + [TASK_HISTORY_PAGE_SIZE + 1])
+    entries = cur.fetchall()
+    cur.close()
+    conn.close()
+    page = entries[:TASK_HISTORY_PAGE_SIZE]
+    rows = "".join(render_task_mark_row(*row, today=today, show_completed=show_completed) for row in page)
+    if len(entries) > TASK_HISTORY_PAGE_SIZE:
+        last = page[-1]
+        colspan = 7 if show_completed == "1" else 6
+        # Следующая страница подгружается при прокрутке до этой строки или по кнопке
+        rows += f'''<tr><td colspan="{colspan}" class="border border-slate-300 p-2 text-center"><button class="text-blue-600 hover:underline mobile-btn" hx-get="/section/tasks/marks/page?show_completed={show_completed}&days={days}&cursor={last[5]}_{last[0]}" hx-trigger="click, revealed" hx-target="closest tr" hx-swap="outerHTML">Показать ещё</button></td></tr>'''
+    return rows
+
 @app.get("/section/tasks/marks", response_class=HTMLResponse)
-async def tasks_marks(show_completed: str = "0"):
-    today = date.today()
-    conn = get_db_connection()
-    cur = conn.cursor()
-    # 1. Для всех задач task ищем записи в task_entry, если нет — создаём
-    cur.execute("SELECT id FROM task;")
-    all_task_ids = [row[0] for row in cur.fetchall()]
-    for task_id in all_task_ids:
-        cur.execute("SELECT 1 FROM task_entry WHERE task_id = %s AND date = %s;", (task_id, today))
-        if not cur.fetchone():
-            cur.execute(
-                "INSERT INTO task_entry (id, task_id, date, completed) VALUES (%s, %s, %s, %s);",
-                (str(uuid.uuid4()), task_id, today, False)
-            )
-    conn.commit()
-    # 2. Для выполненных задач с repeat = DAILY или WEEKLY создаём новые записи, если нужно
-    # DAILY
-    cur.execute('''
-        SELECT t.id, MAX(e.date) as last_date
-        FROM task t
-        JOIN task_entry e ON t.id = e.task_id
-        WHERE t.repeat = 'DAILY' AND e.completed = TRUE
-        GROUP BY t.id
-    ''')
-    for task_id, last_date in cur.fetchall():
-        if last_date is not None and (today - last_date).days >= 1:
-            cur.execute("SELECT 1 FROM task_entry WHERE task_id = %s AND date = %s;", (task_id, today))
-            if not cur.fetchone():
-                cur.execute(
-                    "INSERT INTO task_entry (id, task_id, date, completed) VALUES (%s, %s, %s, %s);",
-                    (str(uuid.uuid4()), task_id, today, False)
-                )
-    # WEEKLY
-    cur.execute('''
-        SELECT t.id, MAX(e.date) as last_date
-        FROM task t
-        JOIN task_entry e ON t.id = e.task_id
-        WHERE t.repeat = 'WEEKLY' AND e.completed = TRUE
-        GROUP BY t.id
-    ''')
-    for task_id, last_date in cur.fetchall():
-        if last_date is not None and (today - last_date).days >= 7:
-            cur.execute("SELECT 1 FROM task_entry WHERE task_id = %s AND date = %s;", (task_id, today))
-            if not cur.fetchone():
-                cur.execute(
-                    "INSERT INTO task_entry (id, task_id, date, completed) VALUES (%s, %s, %s, %s);",
-                    (str(uuid.uuid4()), task_id, today, False)
-                )
-    conn.commit()
-    # 3. Получаем задачи
-    if show_completed == "1":
-        cur.execute('''
-            SELECT e.id, t.name, t.description, t.date, t.repeat, e.date, e.completed
-            FROM task_entry e
-            JOIN task t ON e.task_id = t.id
-            ORDER BY e.date ASC
-        ''')
-    else:
-        cur.execute('''
-            SELECT e.id, t.name, t.description, t.date, t.repeat, e.date, e.completed
-            FROM task_entry e
-            JOIN task t ON e.task_id = t.id
-            WHERE e.completed = FALSE
-            ORDER BY e.date ASC
-        ''')
-    rows = ""
-    for entry_id, name, description, task_date, repeat, entry_date, completed in cur.fetchall():
-        checked = "checked" if completed else ""
-        is_overdue = not completed and entry_date < today
-        row_class = ' class="bg-green-100"' if completed else (' class="bg-red-100"' if is_overdue else '')
-        delete_btn = f'<button class="bg-red-500 hover:bg-red-700 text-white font-bold py-1 px-2 rounded mobile-btn" hx-delete="/section/tasks/marks/delete/{entry_id}" hx-target="closest tr" hx-swap="outerHTML">🗑️</button>' if show_completed == "1" else ""
-        last_col = f'<td class="border border-slate-300 p-2">{delete_btn}</td>' if show_completed == "1" else ""
-        rows += f'''<tr{row_class}><td class="border border-slate-300 p-2">{name}</td><td class="border border-slate-300 p-2">{description or ''}</td><td class="border border-slate-300 p-2">{task_date}</td><td class="border border-slate-300 p-2">{repeat}</td><td class="border border-slate-300 p-2">{entry_date}</td><td class="border border-slate-300 p-2 cursor-pointer" hx-post="/section/tasks/marks/toggle/{entry_id}" hx-target="#tasks-marks-table-area" hx-swap="outerHTML"><input type="checkbox" {checked} class="pointer-events-none"></td>{last_col}</tr>'''
-    cur.close()
-    conn.close()
+@etag_tables("task", "task_entry", daily=True)
+def tasks_marks(show_completed: str = "0", days: int = None):
+    # Записи на сегодня заранее создаёт суточный rollover, здесь только чтение
+    days = TASK_HISTORY_DAYS if days is None else days
+    rows = render_task_marks_page(show_completed, days)
     checked_flag = "checked" if show_completed == "1" else ""
     table_width = "100%"
     th_delete = '<th></th>' if show_completed == "1" else ''
+    window_options = "".join(
+        f'<option value="{value}" {"selected" if value == days else ""}>{label}</option>'
+        for value, label in TASK_HISTORY_WINDOWS
+    )
     html = f'''
     <div id="tasks-marks-table-area">
         <h2 class="text-xl lg:text-2xl font-bold mb-4">Задачи</h2>
-        <label class="inline-flex items-center mb-4">
-            <input type="checkbox" id="show-completed-tasks" {checked_flag} hx-get="/section/tasks/marks" hx-target="#tasks-subsection" hx-swap="innerHTML" hx-vals='{{"show_completed": "{1 if show_completed == "0" else 0}"}}' class="form-checkbox h-5 w-5 text-blue-600">
+        <div class="flex flex-wrap items-center gap-4 mb-4">
+        <label class="inline-flex items-center">
+            <input type="checkbox" id="show-completed-tasks" {checked_flag} hx-get="/section/tasks/marks" hx-target="#tasks-subsection" hx-swap="innerHTML" hx-vals='{{"show_completed": "{1 if show_completed == "0" else 0}", "days": "{days}"}}' class="form-checkbox h-5 w-5 text-blue-600">
             <span class="ml-2 text-gray-700">Показывать выполненные задачи</span>
         </label>
+        <label class="inline-flex items-center">
+            <span class="mr-2 text-gray-700">Период</span>
+            <select name="days" class="border rounded p-1" hx-get="/section/tasks/marks" hx-target="#tasks-subsection" hx-swap="innerHTML" hx-vals='{{"show_completed": "{show_completed}"}}'>{window_options}</select>
+        </label>
+        </div>
         <div class="responsive-table">
         <table id="tasks-marks-table" class="table-auto w-full border-collapse border border-slate-400">
             <thead>
@@ -1126,26 +2066,34 @@ async def tasks_marks(show_completed: str = "0"):
     '''
     return HTMLResponse(html)
 
+@app.get("/section/tasks/marks/page", response_class=HTMLResponse)
+@etag_tables("task", "task_entry", daily=True)
+def tasks_marks_page(show_completed: str = "0", days: int = 0, cursor: str = Query(None)):
+    # Следующая страница отметок: только строки таблицы
+    return HTMLResponse(render_task_marks_page(show_completed, days, parse_task_history_cursor(cursor)))
+
 @app.post("/section/tasks/marks/toggle/{entry_id}", response_class=HTMLResponse)
-async def toggle_task_entry(entry_id: str):
+def toggle_task_entry(entry_id: str, show_completed: str = "0"):
     conn = get_db_connection()
     cur = conn.cursor()
-    cur.execute("SELECT completed FROM task_entry WHERE id = %s;", (entry_id,))
+    # Переключаем отметку одним запросом и возвращаем только изменённую строку
+    cur.execute('''
+        UPDATE task_entry e SET completed = NOT e.completed
+        FROM task t
+        WHERE e.id = %s AND t.id = e.task_id
+        RETURNING e.id, t.name, t.description, t.date, t.repeat, e.date, e.completed;
+    ''', (entry_id,))
     row = cur.fetchone()
-    if not row:
-        cur.close()
-        conn.close()
-        return HTMLResponse("")
-    new_value = not row[0]
-    cur.execute("UPDATE task_entry SET completed = %s WHERE id = %s;", (new_value, entry_id))
     conn.commit()
     cur.close()
     conn.close()
-    # Возвращаем всю таблицу
-    return await tasks_marks()
+    # Выполненная задача пропадает из списка, если выполненные скрыты
+    if not row or (row[6] and show_completed != "1"):
+        return HTMLResponse("")
+    return HTMLResponse(render_task_mark_row(*row, today=current_date(), show_completed=show_completed))
 
 @app.delete("/section/tasks/marks/delete/{entry_id}", response_class=HTMLResponse)
-async def delete_task_entry(entry_id: str):
+def delete_task_entry(entry_id: str):
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute("DELETE FROM task_entry WHERE id = %s;", (entry_id,))
@@ -1162,6 +2110,7 @@ NUTRITION_SECTION_TEMPLATE = '''
         <button class="tab py-2 px-4 text-gray-500 border-b-2 border-transparent hover:border-blue-500 hover:text-blue-500 {active_products} mobile-btn" id="tab-nutrition-products" hx-get="/section/nutrition/products" hx-target="#nutrition-subsection" hx-swap="innerHTML" onclick="setActiveSubTab(this)">Продукты</button>
         <button class="tab py-2 px-4 text-gray-500 border-b-2 border-transparent hover:border-blue-500 hover:text-blue-500 {active_dishes} mobile-btn" id="tab-nutrition-dishes" hx-get="/section/nutrition/dishes" hx-target="#nutrition-subsection" hx-swap="innerHTML" onclick="setActiveSubTab(this)">Блюда</button>
         <button class="tab py-2 px-4 text-gray-500 border-b-2 border-transparent hover:border-blue-500 hover:text-blue-500 {active_weight} mobile-btn" id="tab-nutrition-weight" hx-get="/section/nutrition/weight" hx-target="#nutrition-subsection" hx-swap="innerHTML" onclick="setActiveSubTab(this)">Вес</button>
+        <button class="tab py-2 px-4 text-gray-500 border-b-2 border-transparent hover:border-blue-500 hover:text-blue-500 {active_report} mobile-btn" id="tab-nutrition-report" hx-get="/section/nutrition/report" hx-target="#nutrition-subsection" hx-swap="innerHTML" onclick="setActiveSubTab(this)">Отчёт</button>
     </div>
     <div id="nutrition-subsection" class="p-2 lg:p-4">{content}</div>
 </div>
@@ -1178,7 +2127,8 @@ MEAL_LOG_LIST_TEMPLATE = '''
 <h2 class="text-xl lg:text-2xl font-bold mb-4">Приемы пищи</h2>
 <form hx-post="/section/nutrition/meal-log/add" hx-target="#meal-log-list" hx-swap="outerHTML" class="mb-4 mobile-form">
     <input class="border p-2 rounded" type="date" name="date" value="{date}" required>
-    <select class="border p-2 rounded" name="dish_id" required>
+    <input class="border p-2 rounded" type="search" name="q" placeholder="Поиск блюда" autocomplete="off" hx-get="/section/nutrition/dishes/options" hx-trigger="input changed delay:250ms, search" hx-target="#meal-log-dish-select" hx-swap="innerHTML">
+    <select id="meal-log-dish-select" class="border p-2 rounded" name="dish_id" required>
         <option value="">Блюдо...</option>
         {dish_options}
     </select>
@@ -1217,7 +2167,8 @@ MEAL_LOG_EDIT_TEMPLATE = '''
 <tr id="edit-meal-log-row-{id}">
     <td colspan="3" class="p-2">
         <form hx-post="/section/nutrition/meal-log/edit/{id}?date={date}" hx-target="#meal-log-list" hx-swap="outerHTML">
-            <select class="border p-2 rounded w-full mb-2" name="dish_id" required>
+            <input class="border p-2 rounded w-full mb-2" type="search" name="q" placeholder="Поиск блюда" autocomplete="off" hx-get="/section/nutrition/dishes/options" hx-trigger="input changed delay:250ms, search" hx-target="#meal-log-dish-select-{id}" hx-swap="innerHTML">
+            <select id="meal-log-dish-select-{id}" class="border p-2 rounded w-full mb-2" name="dish_id" required>
                 {dish_options}
             </select>
             <input class="border p-2 rounded w-full mb-2" type="number" step="0.01" name="consumed_grams" value="{consumed_grams}" required>
@@ -1234,24 +2185,83 @@ MEAL_LOG_EDIT_TEMPLATE = '''
 </tr>
 '''
 
-def get_dish_options(selected=None):
+# Поиск по названию в два шага, оба по индексам и с LIMIT, поэтому время не растёт с размером таблицы:
+# совпадения по началу названия (btree text_pattern_ops по lower(name), порядок ~<~ берётся из индекса)
+# и, если их не хватило, ближайшие по триграммам слова (KNN по <<-> через GiST) — опечатки и середина названия.
+NAME_PREFIX_SQL = '''
+    SELECT {columns} FROM {table}
+    WHERE lower(name) LIKE %(prefix)s
+    ORDER BY lower(name) USING ~<~ LIMIT %(limit)s
+'''
+NAME_FUZZY_SQL = '''
+    SELECT {columns} FROM {table}
+    WHERE %(q)s <%% name
+    ORDER BY %(q)s <<-> name LIMIT %(limit)s
+'''
+
+def search_by_name(table, q, columns=("id", "name"), limit=None):
+    """До limit строк с названием, похожим на q, лучшие первыми; пустой q — первые по алфавиту"""
+    limit = limit or SEARCH_LIMIT
+    q = q.strip()[:100]
+    prefix = q.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    params = {"q": q, "prefix": prefix, "limit": limit}
+    fields = sql.SQL(", ").join(map(sql.Identifier, columns))
     conn = get_db_connection()
     cur = conn.cursor()
-    cur.execute("SELECT id, name FROM dish ORDER BY name;")
+    # Запрос с опечаткой не должен подвешивать подсказки: по таймауту отдаём то, что успели найти
+    cur.execute("SET LOCAL statement_timeout = %s;", (SEARCH_TIMEOUT_MS,))
+    cur.execute("SELECT set_config('pg_trgm.word_similarity_threshold', %s, true);", (str(SEARCH_SIMILARITY),))
+    rows = []
+    try:
+        cur.execute(sql.SQL(NAME_PREFIX_SQL).format(columns=fields, table=sql.Identifier(table)), params)
+        rows = cur.fetchall()
+        # Триграммы осмысленны от трёх символов
+        if len(rows) < limit and len(q) >= 3:
+            cur.execute(sql.SQL(NAME_FUZZY_SQL).format(columns=fields, table=sql.Identifier(table)), params)
+            found = {row[0] for row in rows}
+            rows += [row for row in cur.fetchall() if row[0] not in found]
+        cur.execute("SET LOCAL statement_timeout = DEFAULT;")
+    except errors.QueryCanceled:
+        logger.warning("Поиск по %s прерван по таймауту: %r", table, q)
+        conn.rollback()
+    cur.close()
+    conn.close()
+    return rows[:limit]
+
+@cached_fragment("dish")
+def get_dish_options(selected=None, q=""):
+    dishes = search_by_name("dish", q)
+    if selected and all(str(dish_id) != str(selected) for dish_id, _ in dishes):
+        # Блюдо редактируемой записи показываем, даже если оно не в топе
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute("SELECT id, name FROM dish WHERE id = %s;", (selected,))
+        dishes = cur.fetchall() + dishes
+        cur.close()
+        conn.close()
     options = ""
-    for row in cur.fetchall():
-        sel = " selected" if selected and row[0] == selected else ""
-        options += f'<option value="{row[0]}"{sel}>{row[1]}</option>'
-    cur.close()
-    conn.close()
+    for dish_id, name in dishes:
+        sel = " selected" if selected and str(dish_id) == str(selected) else ""
+        options += f'<option value="{dish_id}"{sel}>{name}</option>'
     return options
 
+# Таблицы, от которых зависит список приёмов пищи с калориями
+MEAL_LOG_TABLES = ("meal_log", "dish", "dish_ingredient", "product", "calories_goal")
+
+# Калорийность блюда на 1 грамм по его ингредиентам (скалярный подзапрос, {dish_id} — выражение с id блюда)
+DISH_CALORIES_PER_GRAM_SQL = '''
+    SELECT SUM(di.grams / 100.0 * p.calories_per_100g) / NULLIF(SUM(di.grams), 0)
+    FROM dish_ingredient di JOIN product p ON di.product_id = p.id
+    WHERE di.dish_id = {dish_id}
+'''
+
 def render_meal_log_list(date_str):
     conn = get_db_connection()
     cur = conn.cursor()
-    # Получаем все приёмы пищи за день
+    # Получаем все приёмы пищи за день вместе с их калориями
     cur.execute('''
-        SELECT m.id, d.name, m.dish_id, m.consumed_grams
+        SELECT m.id, d.name, m.dish_id, m.consumed_grams,
+            m.consumed_grams * COALESCE((''' + DISH_CALORIES_PER_GRAM_SQL.format(dish_id="m.dish_id") + '''), 0)
         FROM meal_log m JOIN dish d ON m.dish_id = d.id
         WHERE m.date = %s
         ORDER BY d.name;
@@ -1261,25 +2271,7 @@ def render_meal_log_list(date_str):
         MEAL_LOG_ROW_TEMPLATE.format(id=row[0], dish_name=row[1], consumed_grams=row[3], date=date_str) for row in meal_rows
     )
     # --- КАЛОРИИ ---
-    # Для каждого блюда считаем калории
-    total_calories = 0.0
-    for _, _, dish_id, consumed_grams in meal_rows:
-        # Получаем ингредиенты блюда
-        cur.execute('''
-            SELECT di.grams, p.calories_per_100g
-            FROM dish_ingredient di JOIN product p ON di.product_id = p.id
-            WHERE di.dish_id = %s
-        ''', (dish_id,))
-        ingredients = cur.fetchall()
-        # Считаем калорийность блюда на 1 грамм
-        dish_calories_per_gram = 0.0
-        for grams, cal_per_100g in ingredients:
-            if grams and cal_per_100g:
-                dish_calories_per_gram += (grams / 100.0) * cal_per_100g
-        if ingredients:
-            dish_calories_per_gram = dish_calories_per_gram / sum(g for g, _ in ingredients) if sum(g for g, _ in ingredients) > 0 else 0
-        # Калории за приём пищи
-        total_calories += dish_calories_per_gram * consumed_grams
+    total_calories = sum(row[4] for row in meal_rows)
     # Получаем целевое значение
     target_calories = get_calories_goal()
     calories_block = f'<div class="mb-3"><b>Количество калорий:</b> {int(total_calories)}</div>'
@@ -1295,23 +2287,26 @@ def render_meal_log_list(date_str):
     return MEAL_LOG_LIST_TEMPLATE.format(rows=rows, dish_options=get_dish_options(), date=date_str).replace('<table', calories_block + '<table', 1)
 
 @app.get("/section/nutrition/meal-log", response_class=HTMLResponse)
-async def nutrition_meal_log(date: str = Query(None)):
+@etag_tables(*MEAL_LOG_TABLES, daily=True)
+def nutrition_meal_log(date: str = Query(None)):
     if not date:
-        date = datetime.now().date().isoformat()
+        date = current_date().isoformat()
     return HTMLResponse(render_meal_log_list(date))
 
 @app.post("/section/nutrition/meal-log/add", response_class=HTMLResponse)
-async def add_meal_log(dish_id: str = Form(...), consumed_grams: float = Form(...), date: str = Form(...)):
+def add_meal_log(dish_id: str = Form(...), consumed_grams: float = Form(...), date: str = Form(...)):
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute("INSERT INTO meal_log (id, date, dish_id, consumed_grams) VALUES (%s, %s, %s, %s);", (str(uuid.uuid4()), date, dish_id, consumed_grams))
+    refresh_nutrition_days(cur, [date])
     conn.commit()
     cur.close()
     conn.close()
     return render_meal_log_list(date)
 
 @app.get("/section/nutrition/meal-log/edit/{log_id}", response_class=HTMLResponse)
-async def edit_meal_log_form(log_id: str, date: str = Query(...)):
+@etag_tables("meal_log", "dish")
+def edit_meal_log_form(log_id: str, date: str = Query(...)):
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute("SELECT id, dish_id, consumed_grams FROM meal_log WHERE id = %s;", (log_id,))
@@ -1323,30 +2318,33 @@ async def edit_meal_log_form(log_id: str, date: str = Query(...)):
     return MEAL_LOG_EDIT_TEMPLATE.format(id=row[0], dish_options=get_dish_options(selected=row[1]), consumed_grams=row[2], date=date)
 
 @app.post("/section/nutrition/meal-log/edit/{log_id}", response_class=HTMLResponse)
-async def edit_meal_log(log_id: str, dish_id: str = Form(...), consumed_grams: float = Form(...), date: str = Form(...)):
+def edit_meal_log(log_id: str, dish_id: str = Form(...), consumed_grams: float = Form(...), date: str = Form(...)):
     conn = get_db_connection()
     cur = conn.cursor()
-    cur.execute("UPDATE meal_log SET dish_id = %s, consumed_grams = %s WHERE id = %s;", (dish_id, consumed_grams, log_id))
+    cur.execute("UPDATE meal_log SET dish_id = %s, consumed_grams = %s WHERE id = %s RETURNING date;", (dish_id, consumed_grams, log_id))
+    refresh_nutrition_days(cur, [row[0] for row in cur.fetchall()])
     conn.commit()
     cur.close()
     conn.close()
     return render_meal_log_list(date)
 
 @app.delete("/section/nutrition/meal-log/delete/{log_id}", response_class=HTMLResponse)
-async def delete_meal_log(log_id: str, date: str = Query(...)):
+def delete_meal_log(log_id: str, date: str = Query(...)):
     conn = get_db_connection()
     cur = conn.cursor()
-    cur.execute("DELETE FROM meal_log WHERE id = %s;", (log_id,))
+    cur.execute("DELETE FROM meal_log WHERE id = %s RETURNING date;", (log_id,))
+    refresh_nutrition_days(cur, [row[0] for row in cur.fetchall()])
     conn.commit()
     cur.close()
     conn.close()
     return render_meal_log_list(date)
 
 @app.get("/section/nutrition", response_class=HTMLResponse)
-async def section_nutrition():
-    content = render_meal_log_list(datetime.now().date().isoformat())
+@etag_tables(*MEAL_LOG_TABLES, daily=True)
+def section_nutrition():
+    content = render_meal_log_list(current_date().isoformat())
     html = NUTRITION_SECTION_TEMPLATE.format(
-        active_products="", active_dishes="", active_meal_log="active", active_weight="",
+        active_products="", active_dishes="", active_meal_log="active", active_weight="", active_report="",
         content=content
     )
     return HTMLResponse(html)
@@ -1361,6 +2359,13 @@ PRODUCT_LIST_TEMPLATE = '''
     <input class="border p-2 rounded w-full mb-2" type="text" name="micro_description" placeholder="Описание">
     <button class="bg-blue-500 hover:bg-blue-700 text-white font-bold py-2 px-4 rounded mobile-btn" type="submit">Добавить</button>
 </form>
+<form hx-post="/section/nutrition/products/import" hx-encoding="multipart/form-data" hx-target="#product-import-result" hx-swap="innerHTML" class="mb-4 mobile-form">
+    <input class="border p-2 rounded w-full mb-2" type="file" name="file" accept=".csv,.json,.jsonl,.ndjson" required>
+    <button class="bg-blue-500 hover:bg-blue-700 text-white font-bold py-2 px-4 rounded mobile-btn" type="submit">Импорт из CSV / JSON</button>
+    <div id="product-import-result" class="mt-2"></div>
+</form>
+<input id="product-search" class="border p-2 rounded w-full mb-4" type="search" name="q" placeholder="Поиск продукта" autocomplete="off" hx-get="/section/nutrition/products/search" hx-trigger="input changed delay:250ms, search" hx-target="#product-rows" hx-swap="innerHTML">
+<div class="hidden" hx-get="/section/nutrition/products/search" hx-trigger="products-imported from:body" hx-include="#product-search" hx-target="#product-rows" hx-swap="innerHTML"></div>
 <div class="responsive-table">
 <table class="table-auto w-full border-collapse border border-slate-400">
     <thead>
@@ -1371,7 +2376,7 @@ PRODUCT_LIST_TEMPLATE = '''
             <th class="border border-slate-300 p-2 text-center whitespace-nowrap w-1">Действия</th>
         </tr>
     </thead>
-    <tbody>
+    <tbody id="product-rows">
     {rows}
     </tbody>
 </table>
@@ -1410,33 +2415,72 @@ PRODUCT_EDIT_TEMPLATE = '''
 </tr>
 '''
 
+def render_product_row(row):
+    return PRODUCT_ROW_TEMPLATE.format(id=row[0], name=row[1], calories_per_100g=row[2], micro_description=row[3] or "")
+
+def render_product_rows():
+    return stream_rows("SELECT id, name, calories_per_100g, micro_description FROM product ORDER BY name;", (), render_product_row)
+
+@cached_stream("product")
 def render_product_list():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT id, name, calories_per_100g, micro_description FROM product ORDER BY name;")
-    rows = "".join(
-        PRODUCT_ROW_TEMPLATE.format(id=row[0], name=row[1], calories_per_100g=row[2], micro_description=row[3] or "") for row in cur.fetchall()
-    )
-    cur.close()
-    conn.close()
-    return PRODUCT_LIST_TEMPLATE.format(rows=rows)
+    head, tail = split_template(PRODUCT_LIST_TEMPLATE)
+    yield head
+    yield from render_product_rows()
+    yield tail
 
 @app.get("/section/nutrition/products", response_class=HTMLResponse)
-async def nutrition_products():
-    return HTMLResponse(render_product_list())
+@etag_tables("product")
+def nutrition_products():
+    return stream_html(render_product_list())
+
+@app.get("/section/nutrition/products/search", response_class=HTMLResponse)
+@etag_tables("product")
+def search_products(q: str = ""):
+    # Пустой запрос возвращает полный список, иначе — лучшие совпадения по названию
+    if not q.strip():
+        return stream_html(render_product_rows())
+    rows = search_by_name("product", q, columns=("id", "name", "calories_per_100g", "micro_description"))
+    if not rows:
+        return HTMLResponse('<tr><td colspan="4" class="border border-slate-300 p-2 text-gray-500">Ничего не найдено</td></tr>')
+    return HTMLResponse("".join(render_product_row(row) for row in rows))
 
 @app.post("/section/nutrition/products/add", response_class=HTMLResponse)
-async def add_product(name: str = Form(...), calories_per_100g: float = Form(...), micro_description: str = Form(None)):
+def add_product(name: str = Form(...), calories_per_100g: float = Form(...), micro_description: str = Form(None)):
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute("INSERT INTO product (id, name, calories_per_100g, micro_description) VALUES (%s, %s, %s, %s);", (str(uuid.uuid4()), name, calories_per_100g, micro_description))
     conn.commit()
     cur.close()
     conn.close()
-    return render_product_list()
+    return stream_html(render_product_list())
+
+@app.post("/section/nutrition/products/import", response_class=HTMLResponse)
+def import_products_file(file: UploadFile = File(...)):
+    # Загрузка лежит во временном файле и читается потоком, в БД идёт пачками через COPY
+    conn = get_db_connection()
+    try:
+        summary = import_products(
+            conn, iter_records(file.file, detect_format(file.filename or "")),
+            progress=lambda s, elapsed: logger.info("Импорт продуктов: %s строк за %.1f с", s["rows"], elapsed),
+        )
+        # Импорт мог изменить калорийность многих продуктов — пересчитываем сводку целиком
+        if summary["updated"]:
+            cur = conn.cursor()
+            rebuild_nutrition_daily(cur)
+            conn.commit()
+            cur.close()
+    except ProductImportError as e:
+        return HTMLResponse(f"<div class='error' style='color:red;'>{e}</div>", status_code=400)
+    except UnicodeDecodeError:
+        return HTMLResponse("<div class='error' style='color:red;'>Файл должен быть в кодировке UTF-8</div>", status_code=400)
+    finally:
+        conn.close()
+    # Список продуктов перечитывается по событию products-imported
+    return HTMLResponse(f"<div>{format_summary(summary)}</div>", headers={"HX-Trigger": "products-imported"})
 
 @app.get("/section/nutrition/products/edit/{product_id}", response_class=HTMLResponse)
-async def edit_product_form(product_id: str):
+@etag_tables("product")
+def edit_product_form(product_id: str):
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute("SELECT id, name, calories_per_100g, micro_description FROM product WHERE id = %s;", (product_id,))
@@ -1448,27 +2492,33 @@ async def edit_product_form(product_id: str):
     return PRODUCT_EDIT_TEMPLATE.format(id=row[0], name=row[1], calories_per_100g=row[2], micro_description=row[3] or "")
 
 @app.post("/section/nutrition/products/edit/{product_id}", response_class=HTMLResponse)
-async def edit_product(product_id: str, name: str = Form(...), calories_per_100g: float = Form(...), micro_description: str = Form(None)):
+def edit_product(product_id: str, name: str = Form(...), calories_per_100g: float = Form(...), micro_description: str = Form(None)):
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute("UPDATE product SET name = %s, calories_per_100g = %s, micro_description = %s WHERE id = %s;", (name, calories_per_100g, micro_description, product_id))
+    # Калорийность продукта меняет итоги дней, когда ели блюда с ним
+    refresh_nutrition_days(cur, affected_days(cur, products=[product_id]))
     conn.commit()
     cur.close()
     conn.close()
-    return render_product_list()
+    return stream_html(render_product_list())
 
 @app.delete("/section/nutrition/products/delete/{product_id}", response_class=HTMLResponse)
-async def delete_product(product_id: str):
+def delete_product(product_id: str):
     conn = get_db_connection()
     cur = conn.cursor()
+    # Дни собираем до удаления: ингредиенты с продуктом удаляются каскадно
+    days = affected_days(cur, products=[product_id])
     cur.execute("DELETE FROM product WHERE id = %s;", (product_id,))
+    refresh_nutrition_days(cur, days)
     conn.commit()
     cur.close()
     conn.close()
-    return render_product_list()
+    return stream_html(render_product_list())
 
 @app.get("/section/nutrition/products/row/{product_id}", response_class=HTMLResponse)
-async def product_row(product_id: str):
+@etag_tables("product")
+def product_row(product_id: str):
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute("SELECT id, name, calories_per_100g, micro_description FROM product WHERE id = %s", (product_id,))
@@ -1536,6 +2586,7 @@ DISH_EDIT_TEMPLATE = '''
 </tr>
 '''
 
+@cached_fragment("dish")
 def render_dish_list():
     conn = get_db_connection()
     cur = conn.cursor()
@@ -1547,12 +2598,19 @@ def render_dish_list():
     conn.close()
     return DISH_LIST_TEMPLATE.format(rows=rows)
 
+@app.get("/section/nutrition/dishes/options", response_class=HTMLResponse)
+@etag_tables("dish")
+def dish_options(q: str = ""):
+    # Подсказки для выбора блюда: лучшие совпадения по названию
+    return HTMLResponse(get_dish_options(q=q.strip()) or '<option value="">Ничего не найдено</option>')
+
 @app.get("/section/nutrition/dishes", response_class=HTMLResponse)
-async def nutrition_dishes():
+@etag_tables("dish")
+def nutrition_dishes():
     return HTMLResponse(render_dish_list())
 
 @app.post("/section/nutrition/dishes/add", response_class=HTMLResponse)
-async def add_dish(name: str = Form(...), description: str = Form(None)):
+def add_dish(name: str = Form(...), description: str = Form(None)):
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute("INSERT INTO dish (id, name, description) VALUES (%s, %s, %s);", (str(uuid.uuid4()), name, description))
@@ -1562,7 +2620,8 @@ async def add_dish(name: str = Form(...), description: str = Form(None)):
     return render_dish_list()
 
 @app.get("/section/nutrition/dishes/edit/{dish_id}", response_class=HTMLResponse)
-async def edit_dish_form(dish_id: str):
+@etag_tables("dish")
+def edit_dish_form(dish_id: str):
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute("SELECT id, name, description FROM dish WHERE id = %s;", (dish_id,))
@@ -1574,7 +2633,7 @@ async def edit_dish_form(dish_id: str):
     return DISH_EDIT_TEMPLATE.format(id=row[0], name=row[1], description=row[2] or "")
 
 @app.post("/section/nutrition/dishes/edit/{dish_id}", response_class=HTMLResponse)
-async def edit_dish(dish_id: str, name: str = Form(...), description: str = Form(None)):
+def edit_dish(dish_id: str, name: str = Form(...), description: str = Form(None)):
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute("UPDATE dish SET name = %s, description = %s WHERE id = %s;", (name, description, dish_id))
@@ -1584,10 +2643,13 @@ async def edit_dish(dish_id: str, name: str = Form(...), description: str = Form
     return render_dish_list()
 
 @app.delete("/section/nutrition/dishes/delete/{dish_id}", response_class=HTMLResponse)
-async def delete_dish(dish_id: str):
+def delete_dish(dish_id: str):
     conn = get_db_connection()
     cur = conn.cursor()
+    # Дни собираем до удаления: приёмы пищи с блюдом удаляются каскадно
+    days = affected_days(cur, dishes=[dish_id])
     cur.execute("DELETE FROM dish WHERE id = %s;", (dish_id,))
+    refresh_nutrition_days(cur, days)
     conn.commit()
     cur.close()
     conn.close()
@@ -1601,6 +2663,7 @@ WEIGHT_LIST_TEMPLATE = '''
     <input class="border p-2 rounded" type="number" step="0.01" name="weight" placeholder="Вес (кг)" required>
     <button class="bg-blue-500 hover:bg-blue-700 text-white font-bold py-2 px-4 rounded mobile-btn" type="submit">Добавить</button>
 </form>
+{trend}
 <div class="responsive-table">
 <table class="table-auto w-full border-collapse border border-slate-400">
     <thead>
@@ -1647,24 +2710,97 @@ WEIGHT_EDIT_TEMPLATE = '''
 </tr>
 '''
 
-def render_weight_list():
+# Сколько точек в графике тренда на странице веса
+WEIGHT_CHART_POINTS = 120
+WEIGHT_CHART_WIDTH, WEIGHT_CHART_HEIGHT = 600, 160
+
+WEIGHT_TREND_TEMPLATE = '''
+<div class="mb-4">
+    <div class="flex flex-wrap gap-x-6 gap-y-1 text-sm mb-2">
+        <div><b>Тренд:</b> {trend} кг</div>
+        <div><b>Среднее за 7 / 30 дней:</b> {ma7} / {ma30} кг</div>
+        <div><b>За неделю:</b> {weekly_rate}</div>
+    </div>
+    <svg viewBox="0 0 {width} {height}" preserveAspectRatio="none" class="w-full h-40 border rounded">
+        <polyline fill="none" stroke="#9ca3af" stroke-width="1" vector-effect="non-scaling-stroke" points="{weights}"/>
+        <polyline fill="none" stroke="#2563eb" stroke-width="2" vector-effect="non-scaling-stroke" points="{ema}"/>
+    </svg>
+</div>
+'''
+
+def render_weight_trend():
+    """Сводка тренда и SVG-график взвешиваний и сглаженного тренда"""
     conn = get_db_connection()
     cur = conn.cursor()
-    cur.execute("SELECT id, date, weight FROM personal_data ORDER BY date DESC;")
-    rows = "".join(
-        WEIGHT_ROW_TEMPLATE.format(id=row[0], date=row[1], weight=row[2]) for row in cur.fetchall()
-    )
+    days, weights = load_weight_series(cur)
     cur.close()
     conn.close()
-    from datetime import date as dtdate
-    return WEIGHT_LIST_TEMPLATE.format(rows=rows, today=dtdate.today().isoformat())
+    if len(days) < 2:
+        return ""
+    data = weight_trend(days, weights, WEIGHT_CHART_POINTS)
+    # Масштаб по датам и по весу с отступом 5%, ось Y в SVG направлена вниз
+    first = date(1970, 1, 1) + timedelta(days=int(days[0]))
+    span = int(days[-1] - days[0])
+    low, high = float(weights.min()), float(weights.max())
+    pad = (high - low) * 0.05 or 1.0
+    low, high = low - pad, high + pad
+
+    def polyline(dates, values):
+        return " ".join(
+            f"{(date.fromisoformat(d) - first).days / span * WEIGHT_CHART_WIDTH:.1f},"
+            f"{(high - v) / (high - low) * WEIGHT_CHART_HEIGHT:.1f}"
+            for d, v in zip(dates, values) if v is not None
+        )
+
+    summary = data["summary"]
+    rate = summary["weekly_rate"]
+    return WEIGHT_TREND_TEMPLATE.format(
+        trend=summary["trend"], ma7=summary["ma7"], ma30=summary["ma30"],
+        weekly_rate=f"{rate:+.2f} кг" if rate is not None else "—",
+        width=WEIGHT_CHART_WIDTH, height=WEIGHT_CHART_HEIGHT,
+        weights=polyline(data["weights"]["date"], data["weights"]["weight"]),
+        ema=polyline(data["trend"]["date"], data["trend"]["ema"]),
+    )
+
+def render_weight_list():
+    return render_weight_table(current_date().isoformat())
+
+@cached_stream("personal_data")
+def render_weight_table(today):
+    head, tail = split_template(WEIGHT_LIST_TEMPLATE, today=today, trend=render_weight_trend())
+    yield head
+    yield from stream_rows(
+        "SELECT id, date, weight FROM personal_data ORDER BY date DESC;", (),
+        lambda row: WEIGHT_ROW_TEMPLATE.format(id=row[0], date=row[1], weight=row[2]),
+    )
+    yield tail
 
 @app.get("/section/nutrition/weight", response_class=HTMLResponse)
-async def nutrition_weight():
-    return HTMLResponse(render_weight_list())
+@etag_tables("personal_data", daily=True)
+def nutrition_weight():
+    return stream_html(render_weight_list())
+
+@cached_fragment("personal_data")
+def weight_trend_json(since, points):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    days, weights = load_weight_series(cur, since)
+    cur.close()
+    conn.close()
+    return json.dumps(weight_trend(days, weights, points), ensure_ascii=False, separators=(",", ":"))
+
+@app.get("/section/nutrition/weight/trend")
+@etag_tables("personal_data", daily=True)
+def nutrition_weight_trend(days: int = None, points: int = None):
+    """Сводка и прореженные ряды тренда веса в JSON для графика; days — только последние дни"""
+    today = current_date()
+    # Период длиннее, чем дней от начала календаря, — это вся история
+    since = today - timedelta(days=days - 1) if days and 0 < days <= (today - date.min).days else None
+    points = min(max(points or WEIGHT_TREND_POINTS, 10), 5000)
+    return Response(weight_trend_json(since, points), media_type="application/json")
 
 @app.post("/section/nutrition/weight/add", response_class=HTMLResponse)
-async def add_weight(date: str = Form(...), weight: float = Form(...)):
+def add_weight(date: str = Form(...), weight: float = Form(...)):
     conn = get_db_connection()
     cur = conn.cursor()
     import uuid
@@ -1672,10 +2808,11 @@ async def add_weight(date: str = Form(...), weight: float = Form(...)):
     conn.commit()
     cur.close()
     conn.close()
-    return render_weight_list()
+    return stream_html(render_weight_list())
 
 @app.get("/section/nutrition/weight/edit/{weight_id}", response_class=HTMLResponse)
-async def edit_weight_form(weight_id: str):
+@etag_tables("personal_data")
+def edit_weight_form(weight_id: str):
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute("SELECT id, date, weight FROM personal_data WHERE id = %s;", (weight_id,))
@@ -1687,27 +2824,28 @@ async def edit_weight_form(weight_id: str):
     return WEIGHT_EDIT_TEMPLATE.format(id=row[0], date=row[1], weight=row[2])
 
 @app.post("/section/nutrition/weight/edit/{weight_id}", response_class=HTMLResponse)
-async def edit_weight(weight_id: str, date: str = Form(...), weight: float = Form(...)):
+def edit_weight(weight_id: str, date: str = Form(...), weight: float = Form(...)):
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute("UPDATE personal_data SET date = %s, weight = %s WHERE id = %s;", (date, weight, weight_id))
     conn.commit()
     cur.close()
     conn.close()
-    return render_weight_list()
+    return stream_html(render_weight_list())
 
 @app.delete("/section/nutrition/weight/delete/{weight_id}", response_class=HTMLResponse)
-async def delete_weight(weight_id: str):
+def delete_weight(weight_id: str):
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute("DELETE FROM personal_data WHERE id = %s;", (weight_id,))
     conn.commit()
     cur.close()
     conn.close()
-    return render_weight_list()
+    return stream_html(render_weight_list())
 
 @app.get("/section/nutrition/weight/row/{weight_id}", response_class=HTMLResponse)
-async def weight_row(weight_id: str):
+@etag_tables("personal_data")
+def weight_row(weight_id: str):
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute("SELECT id, date, weight FROM personal_data WHERE id = %s", (weight_id,))
@@ -1720,6 +2858,207 @@ async def weight_row(weight_id: str):
         id=row[0], date=row[1], weight=row[2]
     )
 
+# --- Отчёт по питанию ---
+REPORT_TABLES = ("nutrition_daily", "calories_goal")
+# Сколько периодов показывать по умолчанию и не больше
+REPORT_DEFAULT_COUNT = 12
+REPORT_MAX_COUNT = 120
+
+REPORT_TEMPLATE = '''
+<div id="nutrition-report">
+<h2 class="text-xl lg:text-2xl font-bold mb-4">Отчёт по калориям</h2>
+<div class="flex gap-2 mb-4">
+    <button class="py-2 px-4 rounded mobile-btn {week_class}" hx-get="/section/nutrition/report?period=week" hx-target="#nutrition-report" hx-swap="outerHTML">По неделям</button>
+    <button class="py-2 px-4 rounded mobile-btn {month_class}" hx-get="/section/nutrition/report?period=month" hx-target="#nutrition-report" hx-swap="outerHTML">По месяцам</button>
+</div>
+<div class="mb-3 text-sm text-gray-600">Цель: {target} ккал в день</div>
+<div class="overflow-x-auto">
+<table class="min-w-full bg-white border mobile-table">
+    <thead>
+        <tr>
+            <th class="py-2 px-4 border-b">Период</th>
+            <th class="py-2 px-4 border-b">Дней с записями</th>
+            <th class="py-2 px-4 border-b">В среднем, ккал</th>
+            <th class="py-2 px-4 border-b">Всего, ккал</th>
+            <th class="py-2 px-4 border-b">Цель выполнена</th>
+        </tr>
+    </thead>
+    <tbody>{rows}</tbody>
+</table>
+</div>
+</div>
+'''
+
+REPORT_ROW_TEMPLATE = '''
+<tr>
+    <td class="py-2 px-4 border-b">{period}</td>
+    <td class="py-2 px-4 border-b">{days}</td>
+    <td class="py-2 px-4 border-b">{average}</td>
+    <td class="py-2 px-4 border-b">{calories}</td>
+    <td class="py-2 px-4 border-b {goal_class}">{goal_days} ({goal_percent}%)</td>
+</tr>
+'''
+
+def report_period_label(period, start):
+    if period == "month":
+        return f"{MONTH_NAMES[start.month - 1]} {start.year}"
+    end = start + timedelta(days=6)
+    return f"{start.strftime('%d.%m')} — {end.strftime('%d.%m.%Y')}"
+
+def report_range(period, count, today):
+    """Первый день самого раннего из count последних периодов (неделя с понедельника)"""
+    if period == "week":
+        return today - timedelta(days=today.weekday() + 7 * (count - 1))
+    month = today.year * 12 + today.month - 1 - (count - 1)
+    return date(month // 12, month % 12 + 1, 1)
+
+@cached_fragment(*REPORT_TABLES)
+def render_nutrition_report(period, count, today):
+    target_calories = get_calories_goal()
+    conn = get_db_connection()
+    cur = conn.cursor()
+    report = nutrition_report(cur, period, report_range(period, count, today), today, target_calories)
+    cur.close()
+    conn.close()
+    rows = "".join(
+        REPORT_ROW_TEMPLATE.format(
+            period=report_period_label(period, start), days=days,
+            average=int(average), calories=int(calories),
+            goal_days=goal_days, goal_percent=round(100 * goal_days / days),
+            goal_class="text-green-600" if goal_days == days else "",
+        )
+        for start, days, calories, average, goal_days in report
+    ) or '<tr><td colspan="5" class="py-2 px-4 text-gray-500">Нет приёмов пищи за этот период</td></tr>'
+    active, inactive = "bg-blue-500 text-white", "bg-gray-200 hover:bg-gray-300"
+    return REPORT_TEMPLATE.format(
+        rows=rows, target=target_calories,
+        week_class=active if period == "week" else inactive,
+        month_class=active if period == "month" else inactive,
+    )
+
+@app.get("/section/nutrition/report", response_class=HTMLResponse)
+@etag_tables(*REPORT_TABLES, daily=True)
+def nutrition_report_section(period: str = "week", count: int = REPORT_DEFAULT_COUNT):
+    """Калории и выполнение цели по неделям или месяцам из сводки nutrition_daily"""
+    if period not in REPORT_PERIODS:
+        raise HTTPException(status_code=400, detail="Некорректный период")
+    count = min(max(count, 1), REPORT_MAX_COUNT)
+    return HTMLResponse(render_nutrition_report(period, count, current_date()))
+
+# --- Календарь на месяц ---
+CALENDAR_TABLES = (
+    "habit_entry", "task_entry", "nutrition_daily", "calories_goal", "personal_data",
+)
+
+MONTH_NAMES = (
+    "Январь", "Февраль", "Март", "Апрель", "Май", "Июнь",
+    "Июль", "Август", "Сентябрь", "Октябрь", "Ноябрь", "Декабрь",
+)
+WEEKDAY_NAMES = ("Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс")
+
+# По одному сгруппированному по дням запросу на тип данных за весь диапазон сетки
+CALENDAR_HABITS_SQL = '''
+    SELECT date, COUNT(*) FILTER (WHERE completed), COUNT(*)
+    FROM habit_entry WHERE date BETWEEN %s AND %s
+    GROUP BY date;
+'''
+CALENDAR_TASKS_SQL = '''
+    SELECT date, COUNT(*) FILTER (WHERE completed), COUNT(*)
+    FROM task_entry WHERE date BETWEEN %s AND %s
+    GROUP BY date;
+'''
+CALENDAR_CALORIES_SQL = '''
+    SELECT date, calories
+    FROM nutrition_daily WHERE date BETWEEN %s AND %s;
+'''
+CALENDAR_WEIGHT_SQL = '''
+    SELECT date, AVG(weight)
+    FROM personal_data WHERE date BETWEEN %s AND %s
+    GROUP BY date;
+'''
+
+CALENDAR_TEMPLATE = '''
+<div id="calendar-month">
+    <div class="flex items-center justify-between mb-4">
+        <button class="bg-gray-200 hover:bg-gray-300 py-2 px-4 rounded mobile-btn" hx-get="/section/calendar?month={prev_month}" hx-target="#calendar-month" hx-swap="outerHTML">←</button>
+        <h2 class="text-xl lg:text-2xl font-bold">{title}</h2>
+        <button class="bg-gray-200 hover:bg-gray-300 py-2 px-4 rounded mobile-btn" hx-get="/section/calendar?month={next_month}" hx-target="#calendar-month" hx-swap="outerHTML">→</button>
+    </div>
+    <div class="grid grid-cols-7 gap-1 text-xs lg:text-sm">
+        {weekdays}
+        {days}
+    </div>
+    <div class="mt-3 text-xs text-gray-500">П — привычки, З — задачи (выполнено / всего), К — калории / цель, В — вес</div>
+</div>
+'''
+
+def parse_calendar_month(month):
+    """Параметр "ГГГГ-ММ" -> первый день месяца; по умолчанию — текущий месяц"""
+    if not month:
+        return current_date().replace(day=1)
+    try:
+        first = date.fromisoformat(f"{month}-01")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Некорректный месяц")
+    # Сетка календаря и ссылки на соседние месяцы выходят за месяц на неделю в обе стороны
+    if not MINYEAR < first.year < MAXYEAR:
+        raise HTTPException(status_code=400, detail="Некорректный месяц")
+    return first
+
+def render_calendar_day(day, first_of_month, today, target_calories, habits, tasks, calories, weight):
+    lines = []
+    if day in habits:
+        done, total = habits[day]
+        lines.append(f'<div class="{"text-green-600" if done == total else ""}">П {done}/{total}</div>')
+    if day in tasks:
+        done, total = tasks[day]
+        # Невыполненные задачи в прошлом подсвечиваются
+        lines.append(f'<div class="{"text-orange-600" if done < total and day < today else ""}">З {done}/{total}</div>')
+    if day in calories:
+        reached = calories[day] >= target_calories
+        lines.append(f'<div class="{"text-green-600" if reached else "text-orange-600"}">К {int(calories[day])}/{target_calories}</div>')
+    if day in weight:
+        lines.append(f'<div>В {weight[day]:.1f}</div>')
+    cell_class = "border rounded p-1 min-h-16 lg:min-h-24"
+    if day.month != first_of_month.month:
+        cell_class += " text-gray-400 bg-gray-50"
+    if day == today:
+        cell_class += " border-2 border-blue-500"
+    return f'<div class="{cell_class}"><div class="font-bold">{day.day}</div>{"".join(lines)}</div>'
+
+@cached_fragment(*CALENDAR_TABLES)
+def render_calendar_month(first_of_month, today):
+    """Сетка месяца, дополненная соседними днями до полных недель; по запросу на тип данных"""
+    weeks = Calendar().monthdatescalendar(first_of_month.year, first_of_month.month)
+    start, end = weeks[0][0], weeks[-1][-1]
+    conn = get_db_connection()
+    cur = conn.cursor()
+    data = []
+    for query in (CALENDAR_HABITS_SQL, CALENDAR_TASKS_SQL, CALENDAR_CALORIES_SQL, CALENDAR_WEIGHT_SQL):
+        cur.execute(query, (start, end))
+        data.append({row[0]: row[1:] if len(row) > 2 else row[1] for row in cur.fetchall()})
+    cur.close()
+    conn.close()
+    target_calories = get_calories_goal()
+
+    prev_month = (first_of_month - timedelta(days=1)).replace(day=1)
+    next_month = (first_of_month + timedelta(days=31)).replace(day=1)
+    return CALENDAR_TEMPLATE.format(
+        title=f"{MONTH_NAMES[first_of_month.month - 1]} {first_of_month.year}",
+        prev_month=prev_month.strftime("%Y-%m"),
+        next_month=next_month.strftime("%Y-%m"),
+        weekdays="".join(f'<div class="text-center font-bold text-gray-600">{name}</div>' for name in WEEKDAY_NAMES),
+        days="".join(
+            render_calendar_day(day, first_of_month, today, target_calories, *data)
+            for week in weeks for day in week
+        ),
+    )
+
+@app.get("/section/calendar", response_class=HTMLResponse)
+@etag_tables(*CALENDAR_TABLES, daily=True)
+def section_calendar(month: str = None):
+    return HTMLResponse(render_calendar_month(parse_calendar_month(month), current_date()))
+
 SETTINGS_SECTION_TEMPLATE = '''
 <div>
     <div class="flex border-b tabs">
@@ -1750,6 +3089,18 @@ SETTINGS_TEMPLATE = '''
 </div>
 '''
 
+BACKUP_TEMPLATE = '''
+<div class="max-w-md mx-auto bg-white p-4 lg:p-6 rounded-lg shadow-md mt-4" id="settings-backup">
+    <h2 class="text-xl lg:text-2xl font-bold mb-4 text-gray-800">Резервная копия</h2>
+    <a class="inline-block bg-blue-500 hover:bg-blue-700 text-white font-bold py-2 px-4 rounded mobile-btn" href="/section/settings/export" download>Скачать архив данных</a>
+    <form hx-post="/section/settings/restore" hx-encoding="multipart/form-data" hx-target="#backup-result" hx-swap="innerHTML" hx-confirm="Все данные будут заменены данными из архива. Продолжить?" class="space-y-4 mobile-form mt-4">
+        <input class="shadow appearance-none border rounded w-full py-2 px-3 text-gray-700" type="file" name="file" accept=".zip" required>
+        <button class="bg-red-500 hover:bg-red-700 text-white font-bold py-2 px-4 rounded focus:outline-none focus:shadow-outline mobile-btn" type="submit">Восстановить из архива</button>
+    </form>
+    <div id="backup-result" class="mt-2"></div>
+</div>
+'''
+
 def get_calories_goal():
     conn = get_db_connection()
     cur = conn.cursor()
@@ -1760,20 +3111,22 @@ def get_calories_goal():
     return row[0] if row else 2000
 
 @app.get("/section/settings", response_class=HTMLResponse)
-async def section_settings():
-    content = (await settings_general()).body.decode()
+@etag_tables("calories_goal")
+def section_settings():
+    content = settings_general().body.decode()
     html = SETTINGS_SECTION_TEMPLATE.format(
         content=content
     )
     return HTMLResponse(html)
 
 @app.get("/section/settings/general", response_class=HTMLResponse)
-async def settings_general():
+@etag_tables("calories_goal")
+def settings_general():
     target_calories = get_calories_goal()
-    return HTMLResponse(SETTINGS_TEMPLATE.format(target_calories=target_calories))
+    return HTMLResponse(SETTINGS_TEMPLATE.format(target_calories=target_calories) + BACKUP_TEMPLATE)
 
 @app.post("/section/settings/calories-goal", response_class=HTMLResponse)
-async def set_calories_goal(target_calories: int = Form(...)):
+def set_calories_goal(target_calories: int = Form(...)):
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute("SELECT id FROM calories_goal LIMIT 1;")
@@ -1788,35 +3141,113 @@ async def set_calories_goal(target_calories: int = Form(...)):
     conn.close()
     return HTMLResponse(SETTINGS_TEMPLATE.format(target_calories=target_calories))
 
+@app.get("/section/settings/export")
+def export_data():
+    """Потоковая выгрузка всех данных в zip из одного снимка БД"""
+    def produce(writer):
+        # Архив пишется в отдельном потоке со своим соединением из пула (оно учитывается в DB_POOL_MAX,
+        # но не занимает потоки обработчиков); ответ читает чанки в event loop, не занимая поток
+        error = None
+        pool = init_db_pool()
+        conn = pool.getconn()
+        try:
+            export_archive(conn, writer, BACKUP_TABLES, LATEST_VERSION)
+        except BrokenPipeError:
+            pass
+        except Exception as e:
+            logger.exception("Ошибка выгрузки данных")
+            error = e
+        finally:
+            pool.putconn(conn)
+        try:
+            writer.finish(error)
+        except BrokenPipeError:
+            pass
+
+    async def body():
+        writer = PipeWriter(asyncio.get_running_loop())
+        threading.Thread(target=produce, args=(writer,), name="data-export", daemon=True).start()
+        try:
+            while (chunk := await writer.get()) is not None:
+                yield chunk
+        finally:
+            # Клиент отключился — поток выгрузки прервётся на следующей записи
+            writer.abort()
+
+    filename = f"calendar-backup-{current_date():%Y%m%d}.zip"
+    return ClosingStreamingResponse(body(), media_type="application/zip", headers={
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "Cache-Control": "no-store",
+    })
+
+@app.post("/section/settings/restore", response_class=HTMLResponse)
+def restore_data(file: UploadFile = File(...)):
+    # Загрузка лежит во временном файле, каждая таблица читается из архива потоком в COPY FROM
+    conn = get_db_connection()
+    try:
+        restored = restore_archive(
+            conn, file.file, BACKUP_TABLES, LATEST_VERSION,
+            progress=lambda table, rows: logger.info("Восстановление: %s — %s строк", table, rows),
+        )
+        # Сводка привычек в архиве — на день выгрузки; пересчитываем её на сегодня,
+        # сводку питания — на случай архива, созданного до её появления
+        cur = conn.cursor()
+        rebuild_habit_stats(cur, current_date())
+        rebuild_nutrition_daily(cur)
+        conn.commit()
+        cur.close()
+    except BackupError as e:
+        return HTMLResponse(f"<div class='error' style='color:red;'>{e}</div>", status_code=400)
+    finally:
+        conn.close()
+    return HTMLResponse(f"<div>Данные восстановлены, строк: {sum(restored.values())}. <a class='text-blue-500' href='/'>Обновить страницу</a></div>")
+
 def create_session(user_id):
     token = secrets.token_hex(32)
     conn = get_db_connection()
     cur = conn.cursor()
-    cur.execute("INSERT INTO sessions (id, user_id, session_token) VALUES (%s, %s, %s);",
-                (str(uuid.uuid4()), user_id, token))
+    cur.execute("INSERT INTO sessions (id, user_id, session_token, expires_at) VALUES (%s, %s, %s, LOCALTIMESTAMP + %s * INTERVAL '1 day');",
+                (str(uuid.uuid4()), user_id, token, SESSION_LIFETIME_DAYS))
     conn.commit()
     cur.close()
     conn.close()
     return token
 
+# Кэш token -> (id, username); запись живёт не дольше SESSION_CACHE_TTL и срока сессии
+session_cache = TTLCache(SESSION_CACHE_SIZE, SESSION_CACHE_TTL)
+
 def get_user_by_session_token(token):
     if not token:
         return None
+    user = session_cache.get(token)
+    if user is not None:
+        return user
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute("""
-        SELECT users.id, users.username FROM sessions
+        SELECT users.id, users.username, EXTRACT(EPOCH FROM sessions.expires_at - LOCALTIMESTAMP) FROM sessions
         JOIN users ON sessions.user_id = users.id
-        WHERE session_token = %s;
+        WHERE session_token = %s AND sessions.expires_at > LOCALTIMESTAMP;
     """, (token,))
-    user = cur.fetchone()
+    row = cur.fetchone()
     cur.close()
     conn.close()
+    if not row:
+        return None
+    user = (row[0], row[1])
+    session_cache.set(token, user, ttl=float(row[2]))
     return user
 
+@app.get("/metrics")
+def metrics():
+    """Метрики в текстовом формате Prometheus (см. metrics.py)"""
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
+
 @app.get("/logout")
 def logout(session_token: str = Cookie(None)):
     if session_token:
+        session_cache.pop(session_token)
         conn = get_db_connection()
         cur = conn.cursor()
         cur.execute("DELETE FROM sessions WHERE session_token = %s;", (session_token,))
@@ -1828,7 +3259,8 @@ def logout(session_token: str = Cookie(None)):
     return response
 
 @app.get("/section/habits/habits/row/{habit_id}", response_class=HTMLResponse)
-async def habit_row(habit_id: str):
+@etag_tables("habit", "habit_category")
+def habit_row(habit_id: str):
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute('''
@@ -1846,7 +3278,8 @@ async def habit_row(habit_id: str):
     )
 
 @app.get("/section/tasks/tasks/row/{task_id}", response_class=HTMLResponse)
-async def task_row(task_id: str):
+@etag_tables("task", "task_category")
+def task_row(task_id: str):
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute('''
@@ -1864,7 +3297,8 @@ async def task_row(task_id: str):
     )
 
 @app.get("/section/nutrition/dishes/row/{dish_id}", response_class=HTMLResponse)
-async def dish_row(dish_id: str):
+@etag_tables("dish")
+def dish_row(dish_id: str):
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute("SELECT id, name, description FROM dish WHERE id = %s", (dish_id,))
@@ -1878,7 +3312,8 @@ async def dish_row(dish_id: str):
     )
 
 @app.get("/section/nutrition/meal-log/row/{log_id}", response_class=HTMLResponse)
-async def meal_log_row(log_id: str, date: str = Query(...)):
+@etag_tables("meal_log", "dish")
+def meal_log_row(log_id: str, date: str = Query(...)):
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute('''
@@ -0,0 +1,114 @@
+"""
+Метрики для Prometheus: задержки и число HTTP-запросов по маршрутам, запросы в обработке,
+пул соединений, попадания в кэши, длительность rollover и число строк таблиц записей.
+
+При нескольких воркерах задайте PROMETHEUS_MULTIPROC_DIR — пустой каталог, общий для всех
+процессов: каждый пишет свои счётчики в mmap-файлы, а /metrics суммирует их при чтении.
+"""
+import os
+
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest, multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+MULTIPROCESS = bool(os.getenv('PROMETHEUS_MULTIPROC_DIR'))
+
+# Таблицы, число строк которых отдаётся в calendar_table_rows
+ENTRY_TABLES = ("habit_entry", "task_entry", "meal_log", "personal_data", "nutrition_daily")
+
+# Границы корзин задержки в секундах: страницы приложения обычно укладываются в десятки мс
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REQUEST_LATENCY = Histogram(
+    "calendar_http_request_duration_seconds", "Время ответа до конца тела",
+    ("method", "route"), buckets=LATENCY_BUCKETS,
+)
+REQUESTS = Counter("calendar_http_requests", "HTTP-запросы", ("method", "route", "status"))
+REQUESTS_IN_PROGRESS = Gauge(
+    "calendar_http_requests_in_progress", "HTTP-запросы в обработке", multiprocess_mode="livesum",
+)
+DB_QUERIES = Counter("calendar_db_queries", "Запросы к БД из HTTP-запросов", ("route",))
+DB_SECONDS = Counter("calendar_db_query_seconds", "Время в БД из HTTP-запросов", ("route",))
+DB_CONNECT_SECONDS = Histogram(
+    "calendar_db_connection_wait_seconds", "Ожидание соединения из пула", buckets=LATENCY_BUCKETS,
+)
+DB_POOL_CONNECTIONS = Gauge(
+    "calendar_db_pool_connections", "Соединения пула по состоянию", ("state",), multiprocess_mode="livesum",
+)
+DB_POOL_MAX = Gauge("calendar_db_pool_max_connections", "Предел соединений пула", multiprocess_mode="livesum")
+DB_POOL_TIMEOUTS = Counter("calendar_db_pool_timeouts", "Не дождались свободного соединения")
+CACHE_REQUESTS = Counter("calendar_cache_requests", "Обращения к кэшам", ("cache", "result"))
+ROLLOVER_DURATION = Histogram(
+    "calendar_rollover_duration_seconds", "Создание записей нового дня",
+    buckets=(0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0),
+)
+ROLLOVER_FAILURES = Counter("calendar_rollover_failures", "Неудавшиеся попытки rollover")
+ROLLOVER_LAST_SUCCESS = Gauge(
+    "calendar_rollover_last_success_timestamp_seconds", "Время последнего успешного rollover",
+    multiprocess_mode="max",
+)
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+def observe_request(method, route, status, stats):
+    """Учитывает завершённый HTTP-запрос по его замерам (request_timing.RequestStats)"""
+    timings = stats.timings()
+    REQUEST_LATENCY.labels(method, route).observe(timings["total"] / 1000)
+    REQUESTS.labels(method, route, str(status)).inc()
+    if stats.queries:
+        DB_QUERIES.labels(route).inc(stats.queries)
+        DB_SECONDS.labels(route).inc(stats.db)
+
+class TableRowsCollector:
+    """calendar_table_rows при каждом чтении /metrics: оценка живых строк из pg_stat_user_tables,
+    без COUNT(*) по таблицам, которые растут каждый день
+    """
+
+    def __init__(self, connect):
+        self.connect = connect
+
+    def describe(self):
+        return [GaugeMetricFamily("calendar_table_rows", "Строк в таблице (оценка статистики Postgres)", labels=("table",))]
+
+    def collect(self):
+        family = self.describe()[0]
+        conn = self.connect()
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                "SELECT relname, n_live_tup FROM pg_stat_user_tables WHERE schemaname = 'public' AND relname = ANY(%s);",
+                (list(ENTRY_TABLES),),
+            )
+            for table, rows in cur.fetchall():
+                family.add_metric((table,), rows)
+        finally:
+            cur.close()
+            conn.close()
+        yield family
+
+_table_rows = None
+
+def init_metrics(connect):
+    """Подключает сбор числа строк; connect() возвращает соединение, close() которого его отпускает"""
+    global _table_rows
+    if _table_rows is None:
+        _table_rows = TableRowsCollector(connect)
+        if not MULTIPROCESS:
+            REGISTRY.register(_table_rows)
+
+def render_metrics():
+    """(тело, content-type) в текстовом формате Prometheus"""
+    if not MULTIPROCESS:
+        return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    if _table_rows is not None:
+        registry.register(_table_rows)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+def mark_process_dead():
+    """Убирает живые gauge завершившегося воркера из общего каталога"""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
@@ -0,0 +1,72 @@
+"""
+Версионные миграции схемы БД и журнал schema_version
+"""
+from psycopg2 import errors
+
+# Упорядоченные миграции: (версия, описание, SQL-запросы).
+# Добавление таблиц, столбцов и индексов из SCHEMA выполняется автоматически,
+# здесь — то, что нельзя вывести из SCHEMA: удаления, переименования, перенос данных.
+MIGRATIONS = [
+    (1, "Начальная схема из SCHEMA", []),
+    (2, "Внешние ключи стали DEFERRABLE для восстановления из резервной копии", [
+        """
+        DO $$
+        DECLARE fk record;
+        BEGIN
+            FOR fk IN
+                SELECT conrelid::regclass AS tbl, conname FROM pg_constraint
+                WHERE contype = 'f' AND connamespace = 'public'::regnamespace AND NOT condeferrable
+            LOOP
+                EXECUTE format('ALTER TABLE %s ALTER CONSTRAINT %I DEFERRABLE INITIALLY IMMEDIATE;', fk.tbl, fk.conname);
+            END LOOP;
+        END$$;
+        """,
+    ]),
+    (3, "У sessions.expires_at нет значения по умолчанию: срок задаёт SESSION_LIFETIME_DAYS", [
+        "ALTER TABLE sessions ALTER COLUMN expires_at DROP DEFAULT;",
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+SCHEMA_VERSION_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        schema_hash VARCHAR(64),
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+'''
+
+def read_schema_state(cur):
+    """Возвращает (версия, хэш SCHEMA) последней синхронизации или (0, None) для новой БД"""
+    try:
+        cur.execute("SELECT version, schema_hash FROM schema_version ORDER BY version DESC LIMIT 1;")
+    except errors.UndefinedTable:
+        cur.connection.rollback()
+        return 0, None
+    row = cur.fetchone()
+    return (row[0], row[1]) if row else (0, None)
+
+def apply_migrations(cur, current_version):
+    """Применяет миграции новее current_version по порядку в текущей транзакции"""
+    cur.execute(SCHEMA_VERSION_TABLE_SQL)
+    applied = []
+    for version, description, statements in MIGRATIONS:
+        if version <= current_version:
+            continue
+        for statement in statements:
+            cur.execute(statement)
+        cur.execute(
+            "INSERT INTO schema_version (version, description) VALUES (%s, %s);",
+            (version, description)
+        )
+        applied.append(version)
+    return applied
+
+def record_schema_hash(cur, schema_hash):
+    """Запоминает хэш SCHEMA, к которому приведена БД"""
+    cur.execute(
+        "UPDATE schema_version SET schema_hash = %s WHERE version = (SELECT MAX(version) FROM schema_version);",
+        (schema_hash,)
+    )
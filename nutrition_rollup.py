@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Сводка питания по дням nutrition_daily: калории, граммы и число приёмов пищи за день.
+Изменения приёмов пищи, продуктов и блюд пересчитывают только затронутые дни,
+недельные и месячные отчёты считаются по сводке, а не по приёмам пищи и ингредиентам
+"""
+
+# Итоги дней из meal_log; калорийность на грамм считается один раз для каждого блюда
+DAY_TOTALS_SQL = '''
+    meals AS (
+        SELECT date, dish_id, SUM(consumed_grams) AS grams, COUNT(*) AS meals
+        FROM meal_log
+        WHERE {where}
+        GROUP BY date, dish_id
+    ),
+    dish_calories AS (
+        SELECT di.dish_id, SUM(di.grams / 100.0 * p.calories_per_100g) / NULLIF(SUM(di.grams), 0) AS per_gram
+        FROM dish_ingredient di JOIN product p ON di.product_id = p.id
+        WHERE di.dish_id IN (SELECT dish_id FROM meals)
+        GROUP BY di.dish_id
+    ),
+    totals AS (
+        SELECT m.date, SUM(m.grams * COALESCE(c.per_gram, 0)) AS calories, SUM(m.grams) AS grams, SUM(m.meals) AS meals
+        FROM meals m LEFT JOIN dish_calories c ON c.dish_id = m.dish_id
+        GROUP BY m.date
+    )
+'''
+
+UPSERT_TOTALS_SQL = '''
+    INSERT INTO nutrition_daily (date, calories, grams, meals)
+    SELECT date, calories, grams, meals FROM totals
+    ON CONFLICT (date) DO UPDATE SET
+        calories = EXCLUDED.calories, grams = EXCLUDED.grams, meals = EXCLUDED.meals;
+'''
+
+# Пересчёт перечисленных дней; дни, где приёмов пищи не осталось, удаляются
+REFRESH_DAYS_SQL = '''
+    WITH days AS (
+        SELECT DISTINCT unnest(%(dates)s::date[]) AS date
+    ),
+''' + DAY_TOTALS_SQL.format(where="date IN (SELECT date FROM days)") + ''',
+    removed AS (
+        DELETE FROM nutrition_daily
+        WHERE date IN (SELECT date FROM days) AND date NOT IN (SELECT date FROM totals)
+    )
+''' + UPSERT_TOTALS_SQL
+
+REBUILD_SQL = "WITH " + DAY_TOTALS_SQL.format(where="TRUE") + UPSERT_TOTALS_SQL
+
+# Дни, в которые ели блюда из списка или блюда с продуктами из списка
+AFFECTED_DAYS_SQL = '''
+    SELECT DISTINCT m.date
+    FROM meal_log m
+    WHERE m.dish_id = ANY(%(dishes)s::uuid[])
+       OR m.dish_id IN (SELECT di.dish_id FROM dish_ingredient di WHERE di.product_id = ANY(%(products)s::uuid[]));
+'''
+
+# Отчёт по неделям или месяцам; цель выполнена, если за день набрано не меньше target
+REPORT_SQL = '''
+    SELECT date_trunc(%(period)s, date)::date AS period_start,
+        COUNT(*) AS days,
+        SUM(calories) AS calories,
+        AVG(calories) AS average,
+        COUNT(*) FILTER (WHERE calories >= %(target)s) AS goal_days
+    FROM nutrition_daily
+    WHERE date >= %(since)s AND date <= %(until)s
+    GROUP BY period_start
+    ORDER BY period_start DESC;
+'''
+
+REPORT_PERIODS = ("week", "month")
+
+def affected_days(cur, dishes=(), products=()):
+    """Дни, итоги которых зависят от блюд или продуктов; вызывать до их изменения или удаления"""
+    cur.execute(AFFECTED_DAYS_SQL, {'dishes': list(dishes), 'products': list(products)})
+    return [row[0] for row in cur.fetchall()]
+
+def refresh_nutrition_days(cur, dates):
+    """Пересчитывает сводку за указанные дни в текущей транзакции"""
+    dates = list(dates)
+    if dates:
+        cur.execute(REFRESH_DAYS_SQL, {'dates': dates})
+
+def rebuild_nutrition_daily(cur):
+    """Полный пересчёт сводки по всем приёмам пищи (после импорта, восстановления или правок в обход приложения)"""
+    cur.execute("DELETE FROM nutrition_daily;")
+    cur.execute(REBUILD_SQL)
+    return cur.rowcount
+
+def nutrition_report(cur, period, since, until, target_calories):
+    """[(начало периода, дней с записями, калорий всего, в среднем за день, дней с выполненной целью)]"""
+    if period not in REPORT_PERIODS:
+        raise ValueError(f"Неизвестный период: {period}")
+    cur.execute(REPORT_SQL, {'period': period, 'since': since, 'until': until, 'target': target_calories})
+    return cur.fetchall()
+
+if __name__ == "__main__":
+    import psycopg2
+    from main import DB_CONFIG, init_db_schema
+
+    init_db_schema()
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        cur = conn.cursor()
+        days = rebuild_nutrition_daily(cur)
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"✅ Сводка питания пересчитана, дней: {days}")
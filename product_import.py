@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Массовый импорт продуктов из CSV / JSON через COPY во временную таблицу с upsert по названию
+"""
+import argparse
+import csv
+import io
+import itertools
+import json
+import os
+import sys
+import time
+
+# Сколько строк за раз копируется во временную таблицу и сливается в product
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', '10000'))
+
+# Больше этого одна JSON-запись быть не может — защита от чтения испорченного файла в память
+JSON_MAX_RECORD_BYTES = 1024 * 1024
+
+# Ключ advisory lock: параллельные импорты не должны вставить один продукт дважды
+IMPORT_LOCK_ID = 0x696D706F
+
+# Допустимые названия столбцов во входных файлах
+COLUMN_ALIASES = {
+    "name": ("name", "product", "title", "название"),
+    "calories_per_100g": ("calories_per_100g", "calories", "kcal", "energy_kcal", "ккал"),
+    "micro_description": ("micro_description", "description", "описание"),
+}
+
+STAGING_SQL = '''
+    CREATE TEMP TABLE IF NOT EXISTS product_import (
+        line BIGINT NOT NULL,
+        name TEXT NOT NULL,
+        calories_per_100g FLOAT NOT NULL,
+        micro_description TEXT
+    ) ON COMMIT DROP;
+'''
+
+# Слияние пачки: при повторе названия в пачке побеждает последняя строка файла,
+# существующий продукт (без учёта регистра) обновляется, новый — добавляется
+MERGE_SQL = '''
+    WITH batch AS (
+        SELECT DISTINCT ON (lower(name)) name, calories_per_100g, micro_description
+        FROM product_import
+        ORDER BY lower(name), line DESC
+    ),
+    updated AS (
+        UPDATE product p
+        SET calories_per_100g = b.calories_per_100g,
+            micro_description = COALESCE(b.micro_description, p.micro_description)
+        FROM batch b
+        WHERE lower(p.name) = lower(b.name)
+        RETURNING lower(p.name) AS key
+    ),
+    inserted AS (
+        INSERT INTO product (id, name, calories_per_100g, micro_description)
+        SELECT gen_random_uuid(), b.name, b.calories_per_100g, b.micro_description
+        FROM batch b
+        WHERE lower(b.name) NOT IN (SELECT key FROM updated)
+        RETURNING 1
+    )
+    SELECT (SELECT COUNT(DISTINCT key) FROM updated), (SELECT COUNT(*) FROM inserted);
+'''
+
+class ProductImportError(ValueError):
+    """Файл нельзя импортировать: неизвестный формат или нет обязательных столбцов"""
+
+def _normalize(record):
+    """Приводит запись файла к (name, calories_per_100g, micro_description) или возвращает None"""
+    lowered = {str(k).strip().lower(): v for k, v in record.items()}
+    values = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        values[field] = next((lowered[a] for a in aliases if lowered.get(a) not in (None, "")), None)
+    name = str(values["name"]).strip() if values["name"] is not None else ""
+    if not name:
+        return None
+    try:
+        calories = float(str(values["calories_per_100g"]).replace(",", "."))
+    except (TypeError, ValueError):
+        return None
+    if calories != calories or calories < 0:
+        return None
+    description = values["micro_description"]
+    return name[:255], calories, (str(description) if description is not None else None)
+
+def _iter_json(text):
+    """Объекты из JSON-массива или JSON Lines, читая файл кусками"""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    started = False
+    for chunk in iter(lambda: text.read(64 * 1024), ""):
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        while True:
+            while pos < len(buffer) and (buffer[pos].isspace() or buffer[pos] == ","):
+                pos += 1
+            if not started and buffer[pos:pos + 1] == "[":
+                started = True
+                pos += 1
+                continue
+            if buffer[pos:pos + 1] == "]" or pos >= len(buffer):
+                break
+            try:
+                record, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Объект целиком ещё не прочитан; слишком длинный — значит, файл испорчен
+                if len(buffer) - pos > JSON_MAX_RECORD_BYTES:
+                    raise ProductImportError(f"Некорректный JSON около: {buffer[pos:pos + 40]!r}")
+                break
+            pos = end
+            yield record
+    rest = buffer[pos:].strip().lstrip("]").strip()
+    if rest:
+        raise ProductImportError(f"Некорректный JSON около: {rest[:40]!r}")
+
+def iter_records(fileobj, fmt):
+    """Поток (номер строки, запись) из бинарного файла в формате csv или json"""
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        header = text.readline()
+        # Разделитель определяем по заголовку: экспорт из Excel часто идёт через ";"
+        delimiter = max(",;\t", key=header.count)
+        reader = csv.DictReader(itertools.chain([header], text), delimiter=delimiter)
+        if reader.fieldnames is None or not any(
+            f and f.strip().lower() in COLUMN_ALIASES["name"] for f in reader.fieldnames
+        ):
+            raise ProductImportError("В CSV нет столбца с названием продукта (name)")
+        return ((reader.line_num, record) for record in reader)
+    if fmt == "json":
+        return enumerate(_iter_json(text), start=1)
+    raise ProductImportError(f"Неизвестный формат: {fmt}")
+
+def detect_format(filename):
+    return "json" if filename.lower().endswith((".json", ".jsonl", ".ndjson")) else "csv"
+
+class _CopySource:
+    """Файлоподобный источник для COPY: строки пачки превращаются в CSV по мере чтения"""
+
+    def __init__(self, rows):
+        self._rows = rows
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+        self.count = 0
+        self.error = None
+
+    def read(self, size=-1):
+        size = size if size and size > 0 else 64 * 1024
+        while self._buffer.tell() < size:
+            try:
+                row = next(self._rows, None)
+            except Exception as e:
+                # psycopg2 превращает исключение из read() в QueryCanceled — сохраняем исходное
+                self.error = e
+                row = None
+            if row is None:
+                break
+            self._writer.writerow(row)
+            self.count += 1
+        data = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+def import_products(conn, records, batch_size=None, progress=None):
+    """Импортирует записи в product одной транзакцией; возвращает сводку.
+
+    Записи копируются во временную таблицу пачками через COPY и сливаются в product,
+    так что в памяти одновременно находится не больше одной пачки.
+    """
+    batch_size = batch_size or IMPORT_BATCH_SIZE
+    summary = {"rows": 0, "inserted": 0, "updated": 0, "skipped": 0, "skipped_lines": []}
+
+    def valid_rows():
+        for line, record in records:
+            summary["rows"] += 1
+            row = _normalize(record) if isinstance(record, dict) else None
+            if row is None:
+                summary["skipped"] += 1
+                if len(summary["skipped_lines"]) < 20:
+                    summary["skipped_lines"].append(line)
+                continue
+            yield (line,) + row
+
+    rows = valid_rows()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT pg_advisory_xact_lock(%s);", (IMPORT_LOCK_ID,))
+        cur.execute(STAGING_SQL)
+        started = time.monotonic()
+        while True:
+            source = _CopySource(itertools.islice(rows, batch_size))
+            cur.copy_expert(
+                "COPY product_import (line, name, calories_per_100g, micro_description) FROM STDIN WITH (FORMAT csv)",
+                source,
+            )
+            if source.error is not None:
+                raise source.error
+            if source.count == 0:
+                break
+            cur.execute(MERGE_SQL)
+            updated, inserted = cur.fetchone()
+            summary["updated"] += updated
+            summary["inserted"] += inserted
+            cur.execute("TRUNCATE product_import;")
+            if progress:
+                progress(summary, time.monotonic() - started)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+    return summary
+
+def format_summary(summary):
+    text = (
+        f"Обработано строк: {summary['rows']}, добавлено: {summary['inserted']}, "
+        f"обновлено: {summary['updated']}, пропущено: {summary['skipped']}"
+    )
+    if summary["skipped_lines"]:
+        text += " (строки " + ", ".join(map(str, summary["skipped_lines"])) + ("…" if summary["skipped"] > len(summary["skipped_lines"]) else "") + ")"
+    return text
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Импорт каталога продуктов из CSV или JSON")
+    parser.add_argument("path", help="файл .csv, .json или .jsonl ('-' — stdin)")
+    parser.add_argument("--format", choices=("csv", "json"), help="формат файла (по умолчанию — по расширению)")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE, help="строк в одной пачке COPY")
+    args = parser.parse_args()
+
+    import psycopg2
+    from main import DB_CONFIG, init_db_schema
+
+    init_db_schema()
+    fmt = args.format or detect_format(args.path)
+    fileobj = sys.stdin.buffer if args.path == "-" else open(args.path, "rb")
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        summary = import_products(
+            conn, iter_records(fileobj, fmt), args.batch_size,
+            progress=lambda s, elapsed: print(f"   ... {s['rows']} строк, {elapsed:.1f} с", flush=True),
+        )
+        if summary["updated"]:
+            from nutrition_rollup import rebuild_nutrition_daily
+            cur = conn.cursor()
+            rebuild_nutrition_daily(cur)
+            conn.commit()
+    except ProductImportError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+        fileobj.close()
+    print("✅ " + format_summary(summary))
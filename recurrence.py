@@ -0,0 +1,61 @@
+"""
+Расписание повторяющихся задач: какие записи task_entry должны существовать к дате
+"""
+import os
+
+# Сколько пропущенных дней догоняем для повторяющихся задач
+TASK_BACKFILL_DAYS = int(os.getenv('TASK_BACKFILL_DAYS', '31'))
+
+# Шаг повторения в днях
+REPEAT_STEP_DAYS = {
+    'DAILY': 1,
+    'WEEKLY': 7,
+}
+
+# Все записи task_entry, которых не хватает к дате, одним запросом:
+# - NONE: одна запись на дату задачи, если записей по задаче ещё нет;
+# - DAILY/WEEKLY: записи на каждый день повтора (от даты задачи с шагом step)
+#   после последней существующей записи, но не старше backfill дней.
+# Последняя запись берётся по индексу (task_id, date), без GROUP BY по всей истории.
+DUE_TASK_ENTRIES_SQL = '''
+    WITH last_entry AS (
+        SELECT t.id AS task_id, t.date AS task_date, t.repeat,
+            (SELECT e.date FROM task_entry e WHERE e.task_id = t.id ORDER BY e.date DESC LIMIT 1) AS last_date
+        FROM task t
+        WHERE t.date <= %(day)s
+    ),
+    series AS (
+        SELECT task_id, task_date,
+            CASE repeat WHEN 'WEEKLY' THEN %(weekly_step)s ELSE %(daily_step)s END AS step,
+            GREATEST(COALESCE(last_date + 1, task_date), %(day)s - %(backfill)s, task_date) AS lower_date
+        FROM last_entry
+        WHERE repeat IN ('DAILY', 'WEEKLY')
+    ),
+    due AS (
+        SELECT task_id, task_date AS date
+        FROM last_entry
+        WHERE repeat = 'NONE' AND last_date IS NULL
+        UNION ALL
+        SELECT s.task_id, first_date + s.step * k AS date
+        FROM series s
+        CROSS JOIN LATERAL (
+            SELECT s.task_date + s.step * CEIL((s.lower_date - s.task_date)::numeric / s.step)::int AS first_date
+        ) f
+        CROSS JOIN LATERAL generate_series(0, (%(day)s - f.first_date) / s.step) k
+        WHERE f.first_date <= %(day)s
+    )
+'''
+
+def materialize_task_entries(cur, day, backfill_days=None):
+    """Создаёт все недостающие к дате записи task_entry одним запросом, возвращает число новых"""
+    cur.execute(DUE_TASK_ENTRIES_SQL + '''
+        INSERT INTO task_entry (id, task_id, date, completed)
+        SELECT gen_random_uuid(), task_id, date, FALSE FROM due
+        ON CONFLICT (task_id, date) DO NOTHING;
+    ''', {
+        'day': day,
+        'backfill': TASK_BACKFILL_DAYS if backfill_days is None else backfill_days,
+        'daily_step': REPEAT_STEP_DAYS['DAILY'],
+        'weekly_step': REPEAT_STEP_DAYS['WEEKLY'],
+    })
+    return cur.rowcount
@@ -0,0 +1,141 @@
+"""
+Замеры HTTP-запроса: сколько запросов к БД выполнено и сколько соединений взято из пула,
+время в БД, на получение соединения и остальное (рендеринг). Отдаются заголовком Server-Timing
+и строкой лога; запросы SQL дольше SLOW_QUERY_MS пишутся в лог с текстом и формой параметров
+"""
+import contextvars
+import logging
+import os
+import time
+
+import psycopg2.extensions
+from psycopg2 import sql
+
+# Запросы SQL дольше стольких миллисекунд пишутся в лог; 0 — все запросы
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '200'))
+# Строка лога запроса поднимается до WARNING, если запросов к БД больше (похоже на N+1)
+REQUEST_QUERY_WARN = int(os.getenv('REQUEST_QUERY_WARN', '50'))
+# Отдавать ли заголовок Server-Timing
+SERVER_TIMING = os.getenv('SERVER_TIMING', '1') == '1'
+# Сколько символов текста SQL попадает в лог
+SLOW_QUERY_TEXT_LIMIT = 1000
+
+logger = logging.getLogger("personal_calendar.requests")
+
+class RequestStats:
+    """Счётчики одного HTTP-запроса; время в секундах"""
+    __slots__ = ("started", "queries", "db", "connections", "connect")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db = 0.0
+        self.connections = 0
+        self.connect = 0.0
+
+    def timings(self):
+        """{метрика: миллисекунды}; render — всё, что не БД и не ожидание соединения"""
+        total = time.perf_counter() - self.started
+        return {
+            "db": self.db * 1000,
+            "connect": self.connect * 1000,
+            "render": max(total - self.db - self.connect, 0.0) * 1000,
+            "total": total * 1000,
+        }
+
+    def server_timing(self):
+        t = self.timings()
+        return (
+            f'db;dur={t["db"]:.1f};desc="{self.queries} queries", '
+            f'connect;dur={t["connect"]:.1f};desc="{self.connections} connections", '
+            f'render;dur={t["render"]:.1f}, total;dur={t["total"]:.1f}'
+        )
+
+request_stats = contextvars.ContextVar("request_stats", default=None)
+
+def record_connect(seconds):
+    """Учитывает выдачу соединения из пула (ожидание слота, подключение, проверка)"""
+    stats = request_stats.get()
+    if stats is not None:
+        stats.connections += 1
+        stats.connect += seconds
+
+def _shape(value):
+    if isinstance(value, (list, tuple)):
+        return f"{type(value).__name__}[{len(value)}]"
+    return type(value).__name__
+
+def params_shape(params):
+    """Типы параметров без значений: в лог не должны попадать пароли и личные данные"""
+    if params is None:
+        return "-"
+    if isinstance(params, dict):
+        return "{" + ", ".join(f"{key}: {_shape(value)}" for key, value in params.items()) + "}"
+    return "(" + ", ".join(_shape(value) for value in params) + ")"
+
+def _query_text(cursor, query):
+    if isinstance(query, sql.Composable):
+        query = query.as_string(cursor)
+    if isinstance(query, bytes):
+        query = query.decode(errors="replace")
+    return " ".join(query.split())[:SLOW_QUERY_TEXT_LIMIT]
+
+class TimedCursor(psycopg2.extensions.cursor):
+    """Курсор соединений пула: учитывает запросы в замерах текущего HTTP-запроса"""
+
+    def _record(self, query, params, started, count=1):
+        elapsed = time.perf_counter() - started
+        stats = request_stats.get()
+        if stats is not None:
+            stats.queries += count
+            stats.db += elapsed
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            logger.warning("Медленный запрос %.1f мс, параметры %s: %s",
+                           elapsed * 1000, params_shape(params), _query_text(self, query))
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            self._record(query, vars, started)
+
+    def executemany(self, query, vars_list):
+        vars_list = list(vars_list)
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            self._record(query, vars_list[0] if vars_list else None, started, len(vars_list))
+
+    def copy_expert(self, sql, file, size=8192):
+        started = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            self._record(sql, None, started)
+
+    def fetchmany(self, size=None):
+        args = () if size is None else (size,)
+        # У серверного курсора каждая пачка — отдельный FETCH к БД
+        if self.name is None:
+            return super().fetchmany(*args)
+        started = time.perf_counter()
+        try:
+            return super().fetchmany(*args)
+        finally:
+            stats = request_stats.get()
+            if stats is not None:
+                stats.db += time.perf_counter() - started
+
+def log_request(method, path, status, stats):
+    """Строка лога в формате key=value после отправки ответа"""
+    t = stats.timings()
+    level = logging.WARNING if stats.queries > REQUEST_QUERY_WARN else logging.INFO
+    logger.log(
+        level,
+        "request method=%s path=%s status=%s total_ms=%.1f db_ms=%.1f queries=%d "
+        "connect_ms=%.1f connections=%d render_ms=%.1f",
+        method, path, status, t["total"], t["db"], stats.queries,
+        t["connect"], stats.connections, t["render"],
+    )
@@ -0,0 +1,132 @@
+"""
+Тренд веса: скользящие средние, экспоненциально сглаженный тренд и недельная скорость изменения
+векторно на NumPy, прореживание длинных рядов до фиксированного числа точек для графика
+"""
+import os
+
+import numpy as np
+
+# Сколько точек отдаётся для графика по умолчанию
+WEIGHT_TREND_POINTS = int(os.getenv('WEIGHT_TREND_POINTS', '400'))
+
+# Коэффициент сглаживания тренда за день (как в «The Hacker's Diet»)
+TREND_ALPHA = 0.1
+# Окна скользящих средних в днях
+MOVING_AVERAGE_DAYS = (7, 30)
+
+# Взвешивания по дням (несколько за день усредняются), дата — номер дня от 1970-01-01
+WEIGHT_SERIES_SQL = '''
+    SELECT date - DATE '1970-01-01', AVG(weight)
+    FROM personal_data
+    WHERE %(since)s::date IS NULL OR date >= %(since)s::date
+    GROUP BY date
+    ORDER BY date;
+'''
+
+# Длина блока для ema(): decay ** -block должен оставаться в пределах float64
+EMA_BLOCK = 256
+
+def load_weight_series(cur, since=None):
+    """(дни, вес) из personal_data массивами NumPy"""
+    cur.execute(WEIGHT_SERIES_SQL, {'since': since})
+    rows = cur.fetchall()
+    days = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    weights = np.fromiter((row[1] for row in rows), dtype=np.float64, count=len(rows))
+    return days, weights
+
+def moving_average(values, window):
+    """Скользящее среднее за window последних значений (в начале ряда — по имеющимся)"""
+    sums = np.concatenate(([0.0], np.cumsum(values)))
+    end = np.arange(1, len(values) + 1)
+    start = np.maximum(end - window, 0)
+    return (sums[end] - sums[start]) / (end - start)
+
+def ema(values, alpha=TREND_ALPHA):
+    """Экспоненциальное сглаживание y[k] = y[k-1] + alpha * (x[k] - y[k-1]) без цикла по точкам.
+
+    Внутри блока y[k] = d^(k+1) * y[-1] + alpha * d^k * sum(x[j] / d^j), d = 1 - alpha,
+    поэтому блок считается одним cumsum, а цикл идёт только по блокам.
+    """
+    decay = 1.0 - alpha
+    result = np.empty_like(values)
+    previous = values[0] if len(values) else 0.0
+    powers = decay ** np.arange(EMA_BLOCK + 1)
+    for start in range(0, len(values), EMA_BLOCK):
+        block = values[start:start + EMA_BLOCK]
+        p = powers[:len(block) + 1]
+        result[start:start + len(block)] = p[1:] * previous + alpha * p[:-1] * np.cumsum(block / p[:-1])
+        previous = result[start + len(block) - 1]
+    return result
+
+def _buckets(values, budget):
+    """Ряд, разложенный по строкам на не больше budget равных корзин (хвост дополнен NaN), и смещения корзин"""
+    size = -(-len(values) // budget)
+    count = -(-len(values) // size)
+    padded = np.full(count * size, np.nan)
+    padded[:len(values)] = values
+    return padded.reshape(count, size), np.arange(count) * size
+
+def minmax_downsample(y, budget):
+    """Индексы не больше budget точек для графика: первая, последняя и минимум с максимумом каждой корзины
+    между ними, чтобы не терять выбросы"""
+    if len(y) <= budget:
+        return np.arange(len(y))
+    pairs = (budget - 2) // 2
+    if pairs < 1:
+        return np.unique(np.linspace(0, len(y) - 1, budget).round().astype(np.int64))
+    blocks, offsets = _buckets(y[1:-1], pairs)
+    return np.unique(np.concatenate((
+        [0, len(y) - 1],
+        np.nanargmin(blocks, axis=1) + offsets + 1,
+        np.nanargmax(blocks, axis=1) + offsets + 1,
+    )))
+
+def mean_downsample(values, budget):
+    """Среднее по корзинам для гладких рядов; корзины без значений дают NaN"""
+    if len(values) <= budget:
+        return values
+    blocks, _ = _buckets(values, budget)
+    counts = np.sum(~np.isnan(blocks), axis=1)
+    with np.errstate(invalid="ignore"):
+        return np.nansum(blocks, axis=1) / np.where(counts, counts, np.nan)
+
+def _dates(days):
+    return np.asarray(days, dtype="datetime64[D]").astype(str).tolist()
+
+def _values(values):
+    return [None if np.isnan(v) else v for v in np.round(values, 2).tolist()]
+
+def weight_trend(days, weights, budget=None):
+    """Сводка и ряды для графика не длиннее budget точек"""
+    budget = budget or WEIGHT_TREND_POINTS
+    if len(days) == 0:
+        empty_trend = {"date": [], "ema": [], **{f"ma{window}": [] for window in MOVING_AVERAGE_DAYS}, "weekly_rate": []}
+        return {"points": 0, "summary": None, "weights": {"date": [], "weight": []}, "trend": empty_trend}
+
+    # Пропуски между взвешиваниями заполняются линейной интерполяцией по дням
+    grid = np.arange(days[0], days[-1] + 1)
+    daily = np.interp(grid, days, weights)
+    trend = ema(daily)
+    averages = {f"ma{window}": moving_average(daily, window) for window in MOVING_AVERAGE_DAYS}
+    # Изменение тренда за 7 дней, кг в неделю
+    weekly_rate = np.full(len(grid), np.nan)
+    weekly_rate[7:] = trend[7:] - trend[:-7]
+
+    picked = minmax_downsample(weights, budget)
+    smooth = {"ema": trend, **averages, "weekly_rate": weekly_rate}
+    grid_points = mean_downsample(grid.astype(np.float64), budget)
+    return {
+        "points": int(len(days)),
+        "summary": {
+            "date": _dates(days[-1:])[0],
+            "weight": round(float(weights[-1]), 2),
+            "trend": round(float(trend[-1]), 2),
+            **{name: round(float(series[-1]), 2) for name, series in averages.items()},
+            "weekly_rate": None if np.isnan(weekly_rate[-1]) else round(float(weekly_rate[-1]), 2),
+        },
+        "weights": {"date": _dates(days[picked]), "weight": _values(weights[picked])},
+        "trend": {
+            "date": _dates(np.round(grid_points).astype(np.int64)),
+            **{name: _values(mean_downsample(series, budget)) for name, series in smooth.items()},
+        },
+    }